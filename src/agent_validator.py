@@ -0,0 +1,158 @@
+"""
+Validates the agents of the teams before they are scheduled to play.
+
+Student code is never imported in the manager process: every agent file is compiled and loaded by a short-lived
+worker process (this very script) with a wall-clock and a memory limit, and several workers run concurrently.
+The worker prints the outcome as a single JSON line on its standard output.
+"""
+import concurrent.futures
+import contextlib
+import importlib.machinery
+import importlib.util
+import json
+import logging
+import os
+import pathlib
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, asdict
+from typing import List
+
+try:
+    import resource
+except ImportError:  # not available on Windows, memory is not limited there
+    resource = None
+
+STATUS_OK = "ok"
+STATUS_SYNTAX_ERROR = "syntax_error"
+STATUS_IMPORT_ERROR = "import_error"
+STATUS_RESOURCE_ERROR = "resource_error"  # MemoryError or OSError while loading, e.g. over the memory limit
+STATUS_MISSING_CREATE_TEAM = "missing_create_team"
+STATUS_TIMEOUT = "timeout"
+STATUS_CRASHED = "crashed"
+# Outcomes that depend only on the code of the agent, the others (e.g. a timeout on a loaded node) may be transient
+DETERMINISTIC_STATUSES = (STATUS_OK, STATUS_SYNTAX_ERROR, STATUS_IMPORT_ERROR, STATUS_MISSING_CREATE_TEAM)
+
+
+@dataclass
+class ValidationResult:
+    """Outcome of validating the agent file of a team"""
+    agent_file: str
+    status: str
+    error: str = ""
+    import_time: float = 0.0
+
+    def is_ok(self) -> bool:
+        return self.status == STATUS_OK
+
+    def is_syntax_error(self) -> bool:
+        return self.status == STATUS_SYNTAX_ERROR
+
+    def is_loading_error(self) -> bool:
+        return self.status not in (STATUS_OK, STATUS_SYNTAX_ERROR)
+
+    def is_deterministic(self) -> bool:
+        """Whether validating the same code again would give the same outcome"""
+        return self.status in DETERMINISTIC_STATUSES
+
+    def to_json_obj(self):
+        return asdict(self)
+
+
+def validate_agent_file(agent_file: str) -> ValidationResult:
+    """Compiles and loads an agent file in the current process. Only meant to be called inside a worker."""
+    agent_file = os.path.abspath(agent_file)
+    try:
+        with open(agent_file, "r") as f:
+            source = f.read() + "\n"
+        compile(source, agent_file, "exec")
+    except Exception as e:
+        return ValidationResult(agent_file=agent_file, status=STATUS_SYNTAX_ERROR, error=str(e))
+
+    # just in case other files not in the distribution are loaded
+    sys.path.append(os.path.split(agent_file)[0])
+    start = time.time()
+    try:
+        # Anything printed by the student code must not be mixed with the result line
+        with contextlib.redirect_stdout(sys.stderr):
+            module_name = pathlib.Path(agent_file).stem
+            loader = importlib.machinery.SourceFileLoader(module_name, agent_file)
+            spec = importlib.util.spec_from_loader(module_name, loader)
+            module = importlib.util.module_from_spec(spec)
+            loader.exec_module(module)
+    except (MemoryError, OSError) as e:
+        # Depends on the node and the limits of the worker as much as on the code of the agent
+        return ValidationResult(agent_file=agent_file, status=STATUS_RESOURCE_ERROR, error=repr(e),
+                                import_time=time.time() - start)
+    except BaseException as e:
+        return ValidationResult(agent_file=agent_file, status=STATUS_IMPORT_ERROR, error=repr(e),
+                                import_time=time.time() - start)
+    import_time = time.time() - start
+
+    if not callable(getattr(module, "create_team", None)):
+        return ValidationResult(agent_file=agent_file, status=STATUS_MISSING_CREATE_TEAM,
+                                error=f"{agent_file} does not define a create_team function",
+                                import_time=import_time)
+    return ValidationResult(agent_file=agent_file, status=STATUS_OK, import_time=import_time)
+
+
+class AgentValidator:
+    """Runs the validation of many agent files concurrently, one worker process per agent"""
+    max_workers: int
+    timeout: int
+    memory_limit_mb: int
+
+    def __init__(self, max_workers: int = None, timeout: int = 60, memory_limit_mb: int = 2048):
+        """
+        :param max_workers: number of concurrent workers (defaults to the number of CPUs)
+        :param timeout: wall-clock seconds after which a worker is killed
+        :param memory_limit_mb: data memory limit of each worker (0 disables it)
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+
+    def validate(self, agent_files: List[str]) -> List[ValidationResult]:
+        """Validates all the agent files, returns one result per file in the same order"""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(self._run_worker, agent_files))
+
+    def _run_worker(self, agent_file: str) -> ValidationResult:
+        agent_file = os.path.abspath(agent_file)
+        try:
+            # The worker limits its own memory: preexec_fn is not safe in the threads of the pool
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), agent_file,
+                                      str(self.memory_limit_mb)],
+                                     stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            result = ValidationResult(agent_file=agent_file, status=STATUS_TIMEOUT,
+                                      error=f"Loading the agent took more than {self.timeout} seconds",
+                                      import_time=float(self.timeout))
+        else:
+            lines = process.stdout.strip().splitlines()
+            try:
+                result = ValidationResult(**json.loads(lines[-1]))
+            except (IndexError, ValueError, TypeError):
+                error = process.stderr.strip().splitlines()
+                result = ValidationResult(agent_file=agent_file, status=STATUS_CRASHED,
+                                          error=f"Validation worker exited with code {process.returncode}: "
+                                                f"{error[-1] if error else ''}")
+        logging.info(f"Agent {agent_file}: {result.status} ({result.import_time:.2f}s) {result.error}")
+        return result
+
+
+def limit_memory(memory_limit_mb: int) -> None:
+    """
+    Limits the memory the current process can allocate, 0 for no limit. The data segment is limited rather than
+    the address space: libraries such as torch reserve large address ranges on import that they never use.
+    """
+    if resource is not None and memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+if __name__ == "__main__":
+    # Usage: agent_validator.py <agent file> [<memory limit in MB>]
+    limit_memory(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    print(json.dumps(validate_agent_file(sys.argv[1]).to_json_obj()))
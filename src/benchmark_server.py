@@ -0,0 +1,220 @@
+"""
+Load benchmark of the results web server (flask_app.py or results_server.py).
+
+First create a stand-in dataset: a contest with generated score files and replays in the usual www layout.
+Then start the server to measure from the dataset directory, and run the benchmark against it:
+
+    python benchmark_server.py make-dataset /tmp/bench --teams 40
+    cd /tmp/bench && python <src>/results_server.py --workers 4 --port 5000
+    python benchmark_server.py run --url http://127.0.0.1:5000 --clients 32 --requests 5000
+
+N clients send requests concurrently, each one on its own keep-alive connection, and the p50/p99 latencies are
+reported for each route and overall.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import math
+import os
+import random
+import threading
+import time
+import urllib.parse
+from typing import Dict, List, Tuple
+
+from replay_storage import COMPRESSED_SUFFIX
+from results_store import ResultsStore
+
+BENCHMARK_YEAR = "99"
+BENCHMARK_CONTEST = f"upf-ai{BENCHMARK_YEAR}"
+LAYOUTS = ["defaultCapture", "RANDOM1", "RANDOM2", "RANDOM3"]
+# Share of each route in the requests sent
+ROUTE_WEIGHTS = {"get_matches": 6, "get_teams": 2, "download": 2}
+
+
+def make_dataset(dataset_dir: str, num_teams: int, replay_kb: int, seed: int = 0) -> int:
+    """
+    Writes contests.json and a contest where every team played every other team on every layout.
+
+    :return: the number of matches
+    """
+    rng = random.Random(seed)
+    contest_dir = os.path.join(dataset_dir, "www", f"contest_{BENCHMARK_CONTEST}")
+    for dir_name in ("scores", "replays", "logs"):
+        os.makedirs(os.path.join(contest_dir, dir_name), exist_ok=True)
+    with open(os.path.join(dataset_dir, "contests.json"), "w") as f:
+        json.dump({"contests": [{"name": BENCHMARK_CONTEST, "organizer": "UPF", "last-match-id": 0}]}, f)
+
+    team_names = [f"team{i:03d}" for i in range(num_teams)]
+    match_id = 0
+    for i, blue_name in enumerate(team_names):
+        for red_name in team_names[i + 1:]:
+            match_id += 1
+            games = []
+            for layout in LAYOUTS:
+                score = rng.randint(-18, 18)
+                winner = blue_name if score > 0 else red_name if score < 0 else None
+                games.append([blue_name, red_name, layout, score, winner, round(rng.uniform(20, 300), 2), match_id])
+            wins = sum(game[3] > 0 for game in games)
+            losses = sum(game[3] < 0 for game in games)
+            draws = len(games) - wins - losses
+            sum_score = sum(game[3] for game in games)
+            teams_stats = {
+                blue_name: [100 * (3 * wins + draws) // (3 * len(games)), 3 * wins + draws, wins, draws, losses, 0,
+                            sum_score],
+                red_name: [100 * (3 * losses + draws) // (3 * len(games)), 3 * losses + draws, losses, draws, wins, 0,
+                           -sum_score],
+            }
+            with open(os.path.join(contest_dir, "scores", f"match_{match_id}.json"), "w") as f:
+                json.dump({"games": games, "max_steps": 1200, "layouts": LAYOUTS, "teams_stats": teams_stats}, f)
+            replay = bytes(rng.getrandbits(8) % 16 + 65 for _ in range(replay_kb * 1024))
+            with gzip.open(os.path.join(contest_dir, "replays", f"match_{match_id}.replay{COMPRESSED_SUFFIX}"),
+                           "wb") as f:
+                f.write(replay)
+    # The servers only read the results store, it is filled as the contest manager does
+    with ResultsStore(contest_dir=contest_dir) as results_store:
+        results_store.update()
+    return match_id
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, min(len(sorted_values), math.ceil(pct / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+class LoadBenchmark:
+    """Sends requests to a results server with concurrent clients and records their latencies"""
+    url: str
+    num_clients: int
+    num_requests: int
+
+    def __init__(self, url: str, num_clients: int, num_requests: int, seed: int = 0):
+        parsed_url = urllib.parse.urlparse(url)
+        self.host = parsed_url.hostname
+        self.port = parsed_url.port or 80
+        self.num_clients = max(1, num_clients)
+        self.num_requests = max(1, num_requests)
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_request = 0
+        self.latencies: Dict[str, List[float]] = {route: [] for route in ROUTE_WEIGHTS}
+        self.errors: Dict[str, int] = {route: 0 for route in ROUTE_WEIGHTS}
+
+    def _get(self, connection: http.client.HTTPConnection, path: str) -> Tuple[int, bytes]:
+        connection.request("GET", path, headers={"Accept-Encoding": "gzip"})
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def make_requests(self) -> List[Tuple[str, str]]:
+        """(route, path) of all the requests, drawn before the measure so the clients only send them"""
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        status, body = self._get(connection, f"/get_teams?year={BENCHMARK_YEAR}")
+        if status != 200:
+            raise RuntimeError(f"/get_teams answered {status}, is the server running on the benchmark dataset?")
+        team_names = json.loads(body)["teams"]
+        status, body = self._get(connection, f"/get_matches?year={BENCHMARK_YEAR}&team_name={team_names[0]}"
+                                             f"&limit=1000")
+        download_paths = [match["replay_file"] for match in json.loads(body)["matches"]]
+        connection.close()
+
+        routes = list(ROUTE_WEIGHTS)
+        requests = []
+        for route in self.rng.choices(routes, weights=[ROUTE_WEIGHTS[route] for route in routes],
+                                      k=self.num_requests):
+            if route == "get_matches":
+                query = {"year": BENCHMARK_YEAR, "team_name": self.rng.choice(team_names),
+                         "limit": self.rng.choice([20, 100, 1000])}
+                if self.rng.random() < 0.3:
+                    query["layout"] = self.rng.choice(LAYOUTS)
+                path = f"/get_matches?{urllib.parse.urlencode(query)}"
+            elif route == "get_teams":
+                path = f"/get_teams?year={BENCHMARK_YEAR}"
+            else:
+                path = self.rng.choice(download_paths)
+            requests.append((route, path))
+        return requests
+
+    def _client(self, requests: List[Tuple[str, str]]) -> None:
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        while True:
+            with self._lock:
+                if self._next_request >= len(requests):
+                    break
+                route, path = requests[self._next_request]
+                self._next_request += 1
+            start = time.perf_counter()
+            try:
+                status, _ = self._get(connection, path)
+            except (OSError, http.client.HTTPException):
+                status = None
+                connection.close()
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            latency = time.perf_counter() - start
+            with self._lock:
+                if status == 200:
+                    self.latencies[route].append(latency)
+                else:
+                    self.errors[route] += 1
+        connection.close()
+
+    def run(self) -> float:
+        """Sends all the requests, returns the wall-clock seconds taken"""
+        requests = self.make_requests()
+        self._next_request = 0
+        clients = [threading.Thread(target=self._client, args=(requests,)) for _ in range(self.num_clients)]
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float) -> str:
+        lines = [f"{self.num_requests} requests, {self.num_clients} concurrent clients, {elapsed:.2f}s, "
+                 f"{self.num_requests / elapsed:.1f} requests/s",
+                 f"{'route':<12} {'ok':>7} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}"]
+        all_latencies = []
+        for route, latencies in list(self.latencies.items()) + [("all", None)]:
+            if latencies is None:
+                latencies, errors = all_latencies, sum(self.errors.values())
+            else:
+                all_latencies.extend(latencies)
+                errors = self.errors[route]
+            latencies = sorted(latencies)
+            mean = sum(latencies) / len(latencies) if latencies else float("nan")
+            lines.append(f"{route:<12} {len(latencies):>7} {errors:>7} {1000 * percentile(latencies, 50):>9.2f} "
+                         f"{1000 * percentile(latencies, 99):>9.2f} {1000 * mean:>9.2f}")
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load benchmark of the results web server.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    dataset_parser = subparsers.add_parser('make-dataset', help='creates a stand-in dataset to serve')
+    dataset_parser.add_argument("dataset_dir", type=str, help='directory of the dataset, the server runs from it')
+    dataset_parser.add_argument("--teams", dest='teams', type=int, default=40, help='number of teams')
+    dataset_parser.add_argument("--replay-kb", dest='replay_kb', type=int, default=64,
+                                help='size of each replay before compression, in KiB')
+    run_parser = subparsers.add_parser('run', help='runs the benchmark against a server')
+    run_parser.add_argument("--url", dest='url', type=str, default="http://127.0.0.1:5000", help='server URL')
+    run_parser.add_argument("-c", "--clients", dest='clients', type=int, default=32,
+                            help='number of concurrent clients')
+    run_parser.add_argument("-n", "--requests", dest='requests', type=int, default=2000,
+                            help='total number of requests')
+    args = parser.parse_args()
+
+    if args.command == 'make-dataset':
+        num_matches = make_dataset(args.dataset_dir, args.teams, args.replay_kb)
+        print(f"Dataset with {args.teams} teams and {num_matches} matches written in {args.dataset_dir}")
+    else:
+        benchmark = LoadBenchmark(args.url, args.clients, args.requests)
+        elapsed = benchmark.run()
+        print(benchmark.report(elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 rm slurm-outputs/*
 rm -fr upf-ai*
 rm -fr www
-rm matches.json
+rm matches.json tasks.json
+rm -fr match_ledger
+rm -fr work_queue
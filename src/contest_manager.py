@@ -1,20 +1,29 @@
-import random
 
 from teams_parser import TeamsParser
+import abc
 import json
-from git import Repo
 import os
 from team import Team
-from typing import List
-from contest import capture
+from typing import Dict, List
 import sys
-from html_generator import HtmlGenerator
-import re
+from html_generator import HtmlGenerator, DEFAULT_PAGE_SIZE
+from match_packing import MatchCostEstimator, pack_by_count, pack_by_runtime, get_task_minutes,\
+    tasks_to_json_obj, load_task_matches, get_match_teams
+from results_store import ResultsStore
+from replay_storage import remove_stored_file
+from match_archive import pack_round
+from json_files import dump_json
+from scheduler import FORMAT_ADAPTIVE, FORMAT_ROUND_ROBIN, FORMAT_SWISS, FORMATS, schedule
+from ratings import RatingEngine
+from match_runner import LocalMatchRunner, load_matches, run_match
+from match_ledger import MatchLedger
+from work_queue import QUEUE_DIR, WorkQueue
+from agent_validator import AgentValidator, ValidationResult
+from validation_cache import ValidationCache, get_engine_version, hash_python_files
 import logging
-import importlib.util
-import importlib.machinery
-import pathlib
 import argparse
+import datetime
+import math
 
 #-------------------------------------
 def load_settings():
@@ -31,12 +40,93 @@ def load_settings():
         dest='task', type=str, required=False,
         help='task number. Argument used when parallelizing games in the cluster'
         )
+    parser.add_argument(
+        "-j", "--jobs",
+        dest='jobs', type=int, default=1,
+        help='number of matches played in parallel when running locally'
+        )
+    parser.add_argument(
+        "--match-timeout",
+        dest='match_timeout', type=int, default=None,
+        help='seconds after which a match played locally is killed'
+        )
+    parser.add_argument(
+        "--matches-per-task",
+        dest='matches_per_task', type=int, default=1,
+        help='number of matches played by each task of the Slurm array'
+        )
+    parser.add_argument(
+        "--pack-by",
+        dest='pack_by', type=str, choices=['count', 'runtime'], default='count',
+        help='pack matches into tasks by number of matches or by estimated runtime'
+        )
+    parser.add_argument(
+        "--tasks",
+        dest='tasks', type=int, default=None,
+        help='number of tasks of the Slurm array when packing by runtime'
+        )
+    parser.add_argument(
+        "--cpus-per-task",
+        dest='cpus_per_task', type=int, default=1,
+        help='number of cores allocated to each task of the Slurm array'
+        )
+    parser.add_argument(
+        "--page-size",
+        dest='page_size', type=int, default=DEFAULT_PAGE_SIZE,
+        help='number of games per page of the HTML games list'
+        )
+    parser.add_argument(
+        "--format",
+        dest='format', type=str, choices=FORMATS, default=FORMAT_ROUND_ROBIN,
+        help='how the matches of a round are chosen: round-robin (new or updated teams against all), '
+             'swiss, sampled or adaptive (pairs of teams whose order is the most uncertain given their ratings)'
+        )
+    parser.add_argument(
+        "--matches-per-team",
+        dest='matches_per_team', type=int, default=4,
+        help='number of opponents of every team with the sampled format'
+        )
+    parser.add_argument(
+        "--swiss-rounds",
+        dest='swiss_rounds', type=int, default=1,
+        help='number of rounds scheduled at once with the swiss format'
+        )
+    parser.add_argument(
+        "--matches-budget",
+        dest='matches_budget', type=int, default=None,
+        help='number of matches of a round with the adaptive format (default: matches per team x teams / 2)'
+        )
+    parser.add_argument(
+        "--seed",
+        dest='seed', type=str, default=None,
+        help='seed of the pairings and colours (by default, derived from the contest and its last match id)'
+        )
+    parser.add_argument(
+        "--retries",
+        dest='retries', type=int, default=1,
+        help='number of times a crashed match is played again when running locally'
+        )
+    parser.add_argument(
+        "--executor",
+        dest='executor', type=str, choices=list(EXECUTORS), default='slurm',
+        help='how the prepared matches are played: Slurm array, local pool of workers or shared work queue'
+        )
+    parser.add_argument(
+        "--queue-dir",
+        dest='queue_dir', type=str, default=QUEUE_DIR,
+        help='directory of the work queue, on a file system shared by all the workers'
+        )
 
    
     args = parser.parse_args()
 
     # First get the options from the configuration file if available
-    settings = {'step': args.step, 'task': args.task}
+    settings = {'step': args.step, 'task': args.task, 'jobs': args.jobs, 'match_timeout': args.match_timeout,
+                'retries': args.retries, 'matches_per_task': args.matches_per_task,
+                'cpus_per_task': args.cpus_per_task, 'pack_by': args.pack_by, 'tasks': args.tasks,
+                'page_size': args.page_size, 'format': args.format, 'matches_per_team': args.matches_per_team,
+                'swiss_rounds': args.swiss_rounds, 'matches_budget': args.matches_budget, 'seed': args.seed,
+                'executor': args.executor, 'queue_dir': args.queue_dir}
 
     logging.info(f'Contest manager settings: {settings}')
 
@@ -48,11 +138,27 @@ class ContestManager:
     contests: dict
     www_dir: str
 
-    def __init__(self, contests_json_file: str = ""):
+    def __init__(self, contests_json_file: str = "", lazy: bool = False, sync_workers: int = 8,
+                 sync_timeout: int = 300, validation_workers: int = None, validation_timeout: int = 60):
+        """
+        Loads the contests and, unless lazy, synchronizes and validates all the team repositories.
+
+        :param contests_json_file: JSON file listing the contests
+        :param lazy: postpone the repository sync/validation phase until the teams are first needed
+        :param sync_workers: number of repositories synchronized concurrently
+        :param sync_timeout: seconds after which a git clone/pull is killed
+        :param validation_workers: number of agents validated concurrently (defaults to the number of CPUs)
+        :param validation_timeout: seconds after which the validation of an agent is aborted
+        """
         self.contests = {}
         self.www_dir = "www"
         self.matches = {}
         self.match_counter = 1
+        self.sync_workers = sync_workers
+        self.sync_timeout = sync_timeout
+        self.validation_workers = validation_workers
+        self.validation_timeout = validation_timeout
+        self.teams_prepared = False
 
         with open(contests_json_file, "r") as f:
             json_contests = json.load(f)
@@ -64,79 +170,89 @@ class ContestManager:
                     "last_match_id": int(contest_data_teams['last-match-id'])
                 }
         logging.info(self.contests)
+        if not lazy:
+            self.prepare_teams()
+
+    def prepare_teams(self) -> None:
+        """Clones/pulls, validates and cleans up old matches of all the teams (only once)"""
+        if self.teams_prepared:
+            return
+        self.teams_prepared = True
+        # Imported here so that steps not touching the repositories do not pay for loading GitPython
+        from repo_sync import RepoSyncer, summarize
+
         if not os.path.exists('slurm-outputs'):
                     os.makedirs('slurm-outputs')
-        for contest_name in self.contests:
-            contest_data_teams = self.contests[contest_name]["teams"]
-            for team in contest_data_teams.get_teams():
-                repo_local_dir = self.get_repo_dir(contest_name, team)
-                
-                logging.info(f"Repository local dir: {repo_local_dir} (exists? {self.repo_exists(repo_local_dir)})")
-                if not self.repo_exists(repo_local_dir):
-                    setattr(team, "last_commit", "")
-                    repo = self.clone_repo(url=team.get_repository(), dest_folder=repo_local_dir)
-                else:
-                    repo = self.get_cloned_repo(dest_folder=repo_local_dir)
-                logging.info(f"Repository commit: {self.get_repo_commit(repo=repo)}")
-                if self.is_repo_updated(repo=repo, last_commit=team.get_last_commit()):
-                    logging.info("The repository has been updated!")
-                    setattr(team, "last_commit", self.get_repo_commit(repo=repo))
-                    setattr(team, "updated", True)
-                    assert team.get_last_commit() == self.get_repo_commit(repo=repo)
-                else:
-                    setattr(team, "updated", False)
-                error_dir = os.path.join(self.www_dir, f"contest_{contest_name}/errors")
-                if not os.path.exists(error_dir):
-                    os.makedirs(error_dir)
-                error = self.check_syntax_error(repo_local_dir, contest_name)
-                loading_error = self.check_loading_errors(False, repo_local_dir, contest_name)
-
-                if error:
-                    setattr(team, "syntax_error", True)
-                        
-                if loading_error == [None,None]:
-                    setattr(team, "loading_error", True)
-
-                    
 
+        # Clone/pull all the team repositories of all the contests concurrently
+        sync_jobs = [(contest_name, team, self.get_repo_dir(contest_name, team))
+                     for contest_name in self.contests
+                     for team in self.contests[contest_name]["teams"].get_teams()]
+        sync_results = RepoSyncer(max_workers=self.sync_workers, timeout=self.sync_timeout).sync(sync_jobs)
+        self.sync_summary = summarize(sync_results)
+
+        engine_version = get_engine_version()
+        validation_caches = {contest_name: ValidationCache(json_file=ValidationCache.get_file_name(contest_name),
+                                                           engine_version=engine_version)
+                             for contest_name in self.contests}
+        agents_to_validate = []
+        num_cached = 0
+        for (contest_name, team, repo_local_dir), sync_result in zip(sync_jobs, sync_results):
+            if sync_result.is_updated():
+                logging.info(f"The repository {repo_local_dir} has been updated!")
+                setattr(team, "last_commit", sync_result.commit)
+                setattr(team, "updated", True)
+            else:
+                setattr(team, "updated", False)
+            error_dir = os.path.join(self.www_dir, f"contest_{contest_name}/errors")
+            if not os.path.exists(error_dir):
+                os.makedirs(error_dir)
+            if not os.path.isfile(os.path.join(repo_local_dir, "my_team.py")):
+                logging.warning(f"No agent found at {repo_local_dir}, team {team.get_name()} is disqualified")
+                setattr(team, "loading_error", True)
+                continue
+            # The commit identifies the code of the team, unless the sync failed and the checkout is unknown
+            code_version = sync_result.commit or hash_python_files(repo_local_dir)
+            cached_result = validation_caches[contest_name].get(team.get_name(), code_version)
+            if cached_result is not None:
+                self.apply_validation_result(contest_name, team, repo_local_dir, cached_result)
+                num_cached += 1
+            else:
+                agents_to_validate.append((contest_name, team, repo_local_dir, code_version))
+        logging.info(f"Agents to validate: {len(agents_to_validate)} "
+                     f"(cached: {num_cached})")
+
+        # Compile and load the new/updated agents in isolated worker processes
+        validation_results = AgentValidator(max_workers=self.validation_workers,
+                                            timeout=self.validation_timeout).validate(
+            [os.path.join(repo_local_dir, "my_team.py") for _, _, repo_local_dir, _ in agents_to_validate])
+        for (contest_name, team, repo_local_dir, code_version), result in zip(agents_to_validate,
+                                                                              validation_results):
+            self.apply_validation_result(contest_name, team, repo_local_dir, result)
+            validation_caches[contest_name].put(team.get_name(), code_version, result)
+        for validation_cache in validation_caches.values():
+            validation_cache.save()
+
+        for contest_name in self.contests:
             """Clean up old matches of updated teams, at the end there 
             must be n*(n-1)/2 matches where n is the number of teams"""
-            self.clean_up_old_matches(contest_name, contest_data_teams)
+            self.clean_up_old_matches(contest_name, self.contests[contest_name]["teams"])
 
     @staticmethod
     def get_repo_dir(contest_name, team):
         """Generate the repository local directory"""
         return contest_name + "_" + team.get_name()
 
-    @staticmethod
-    def repo_exists(repo_dir):
-        """Check if the repository already exists locally"""
-        return os.path.isdir(repo_dir)  # optional +"/.git"
-
-    @staticmethod
-    def clone_repo(url: str, dest_folder: str) -> Repo:
-        """Method to easily clone a public repository"""
-        return Repo.clone_from(url, dest_folder)  # optional argument branch='main'
-
-    @staticmethod
-    def get_cloned_repo(dest_folder: str) -> Repo:
-        """Method to get an already cloned repository"""
-        return Repo(dest_folder)
-
-    @staticmethod
-    def get_repo_commit(repo: Repo) -> str:
-        return str(repo.head.reference.commit)
-
-    def is_repo_updated(self, repo: Repo, last_commit: str) -> bool:
-        return self.get_repo_commit(repo=repo) != last_commit
+    def get_last_match_id(self, contest_name: str) -> int:
+        return self.contests[contest_name]["last_match_id"]
 
     def get_contest_names(self):
         return [contest_name for contest_name in self.contests]
 
     def dump_contest_teams_json_file(self, contest_name: str, dest_file_name: str) -> None:
         assert contest_name in self.contests
-        with open(dest_file_name, "w") as f:
-            f.write(json.dumps(self.contests[contest_name]["teams"].to_json_obj(), sort_keys=True, indent=4))
+        # The teams are serialized with their keys already in sorted order, they are not sorted again
+        dump_json(self.contests[contest_name]["teams"].to_json_obj(), dest_file_name, indent=4)
 
     def dump_contests_json_file(self):
         data = []
@@ -144,66 +260,46 @@ class ContestManager:
             data.append({"name": contest_name,
                          "organizer": self.contests[contest_name]["organizer"],
                          "last-match-id": int(self.contests[contest_name]["last_match_id"])})
-        with open("contests.json", "w") as f:
-            f.write(json.dumps({"contests": data}, sort_keys=True, indent=4))
+        dump_json({"contests": data}, "contests.json", sort_keys=True, indent=4)
             
-    def dump_matches_json_file(self):
-        with open("matches.json", "w") as f:
-            json.dump(self.matches, f)
-    
-    def check_syntax_error(self, filename, contest_name):
-        source = open(filename+'/my_team.py', 'r').read() + '\n'
-        try:
-            compile(source, filename, 'exec')
-        except Exception as Argument:
-            with open(f"www/contest_{contest_name}/errors/{filename}.log", 'w') as file:
-                file.write(str(Argument))
-                file.close()
-            return True
-    
-    def check_loading_errors(self, isRed, filename, contest_name):
-        try:
-            self.load_agents(isRed, filename+'/my_team.py')
-        except Exception as Argument:
-            with open(f"www/contest_{contest_name}/errors/{filename}.log", 'w') as file:
-                file.write(str(Argument))
-                file.close()
-            return True
-    # def get_new_teams(self, contest_name: str) -> List[Team]:
-    #     """Return the list of new/updated teams of a given contest"""
-    #     assert contest_name in self.contests
-    #     return [team for team in self.contests[contest_name].get_teams() if team.get_updated()]
-
-
-    
-    def load_agents(self, is_red, agent_file, cmd_line_args=[]):
-            if not agent_file.endswith(".py"):
-                agent_file += ".py"
-
-            module_name = pathlib.Path(agent_file).stem
-            agent_file = os.path.abspath(agent_file)
-
-        # just in case other files not in the distribution are loaded
-            sys.path.append(os.path.split(agent_file)[0])
-
-
-        # SS: new way of loading Python modules - Python 3.4+
-            loader = importlib.machinery.SourceFileLoader(module_name, agent_file)
-            spec = importlib.util.spec_from_loader(module_name, loader)
-            module = importlib.util.module_from_spec(spec)
-            loader.exec_module(module)  # will be added to sys.modules dict
+    def matches_to_json_obj(self):
+        return {str(match_id): match_arguments for match_id, match_arguments in self.matches.items()}
 
+    def dump_matches_json_file(self):
+        dump_json(self.matches_to_json_obj(), "matches.json")
 
-            create_team_func = getattr(module, 'create_team')
+    @staticmethod
+    def dump_tasks_json_file(tasks: List[List[str]]):
+        dump_json(tasks_to_json_obj(tasks), "tasks.json")
 
+    @staticmethod
+    def dump_slurm_array_file(num_tasks: int, cpus_per_task: int, task_minutes: int):
+        with open('slurm-array-template.sh', 'r') as template:
+            filedata = template.read()
 
-            return 'All good'
-    
-    
+        filedata = filedata.replace('$1', str(num_tasks))
+        filedata = filedata.replace('$2', str(cpus_per_task))
+        filedata = filedata.replace('$3', f"{task_minutes}:00")
+        with open('slurm-array.sh', 'w') as file:
+            file.write(filedata)
     
+    def apply_validation_result(self, contest_name: str, team: Team, repo_local_dir: str,
+                                result: ValidationResult) -> None:
+        """Flags the team according to the validation of its agent and writes (or removes) its error log"""
+        setattr(team, "syntax_error", result.is_syntax_error())
+        setattr(team, "loading_error", result.is_loading_error())
+        error_file = os.path.join(self.www_dir, f"contest_{contest_name}/errors/{repo_local_dir}.log")
+        if result.is_ok():
+            if os.path.exists(error_file):
+                os.remove(error_file)
+            return
+        with open(error_file, 'w') as file:
+            file.write(f"{result.status}: {result.error}")
+
     def get_all_teams(self, contest_name: str) -> List[Team]:
         """Returns all teams of a given contest"""
         assert contest_name in self.contests
+        self.prepare_teams()
         return self.contests[contest_name]["teams"].get_teams()
 
     @staticmethod
@@ -220,33 +316,21 @@ class ContestManager:
         if not os.path.isdir(scores_dir) or not os.path.isdir(replays_dir) or not os.path.isdir(logs_dir):
             return
 
-        # Collect all files in scores directory
-        all_score_files = [f for f in os.listdir(scores_dir) if os.path.isfile(os.path.join(scores_dir, f))]
-
-        pattern = re.compile(r'match_([-+\dT:.]+)\.json')
-
-        for score_filename in all_score_files:
-            match = pattern.match(score_filename)
-            if not match:
-                continue
-
-            # Extract the id for that particular content from the score file match_{id}.score
-            match_id = match.group(1)
-
-            with open(os.path.join(scores_dir, score_filename), 'r') as f:
-                match_data = json.load(f)
-                for team_name, _ in match_data["teams_stats"].items():
-                    # Delete an old match if at least one team has been updated
-                    if contest_data_teams.get_team(team_name).get_updated():
-                        os.remove(os.path.join(scores_dir, score_filename))
-                        replay_filename = score_filename[:-5]+".replay"  # remove .json and add .replay
-                        os.remove(os.path.join(replays_dir, replay_filename))
-                        log_filename = score_filename[:-5]+".log"  # remove .json and add .log
-                        os.remove(os.path.join(logs_dir, log_filename))
-                        logging.info(f"Deleted match #{match_id}, files: {score_filename}, {replay_filename}, "
-                                     f"{log_filename}")
-                        break
-                        
+        with ResultsStore(contest_dir=os.path.join(self.www_dir, f"contest_{contest_name}")) as results_store:
+            results_store.update()
+            # Delete an old match if at least one team has been updated
+            updated_team_names = [team.get_name() for team in contest_data_teams.get_teams() if team.get_updated()]
+            for match_id in results_store.get_match_ids_of_teams(updated_team_names):
+                score_filename = f"match_{match_id}.json"
+                replay_filename = f"match_{match_id}.replay"
+                log_filename = f"match_{match_id}.log"
+                # Replays and logs may be stored compressed
+                for file_path in (os.path.join(scores_dir, score_filename), os.path.join(replays_dir, replay_filename),
+                                  os.path.join(logs_dir, log_filename)):
+                    remove_stored_file(file_path)
+                results_store.remove_match(match_id)
+                logging.info(f"Deleted match #{match_id}, files: {score_filename}, {replay_filename}, "
+                             f"{log_filename}")
 
     def submit_match(self, contest_name: str, blue_team: Team, red_team: Team) -> None:
         """Call the two agents Slurm script"""
@@ -266,13 +350,12 @@ class ContestManager:
         self.contests[contest_name]["last_match_id"] = last_match_id
         self.matches[self.match_counter] = match_arguments
         self.match_counter += 1
-        print(self.matches)
 
         
 
 
-    def generate_html(self) -> None:
-        web_gen = HtmlGenerator(www_dir=self.www_dir)
+    def generate_html(self, page_size: int = DEFAULT_PAGE_SIZE) -> None:
+        web_gen = HtmlGenerator(www_dir=self.www_dir, page_size=page_size)
 
         for idx, contest_name in enumerate(self.contests):
             web_gen.add_contest_run(run_id=idx,
@@ -280,57 +363,195 @@ class ContestManager:
                                     organizer=self.contests[contest_name]["organizer"])
 
 
+def record_match_results(www_dir: str, matches: dict) -> None:
+    """Adds the score files of the given finished matches to the results store of their contest"""
+    contest_scores = {}
+    for match_arguments in matches.values():
+        contest_name = match_arguments[match_arguments.index("--contest-name") + 1]
+        contest_scores.setdefault(contest_name, []).append(match_arguments[match_arguments.index("-m") + 1])
+    for contest_name, score_ids in contest_scores.items():
+        with ResultsStore(contest_dir=os.path.join(www_dir, f"contest_{contest_name}")) as results_store:
+            for score_id in score_ids:
+                results_store.add_score_file(score_id)
+
+
+class MatchExecutor(abc.ABC):
+    """Plays matches of matches.json: the steps prepare_matches and resume submit their matches to an executor"""
+
+    def __init__(self, contest_manager: ContestManager, settings: dict):
+        """
+        :param contest_manager: manager of the contests of the matches, None if only the matches file is loaded
+        :param settings: settings of the command line, see load_settings
+        """
+        self.contest_manager = contest_manager
+        self.settings = settings
+
+    @abc.abstractmethod
+    def submit(self, matches: Dict[str, list]) -> None:
+        """Plays, or prepares everything to play, the given matches (by match id)"""
+
+
+class SlurmArrayExecutor(MatchExecutor):
+    """The matches are packed into the tasks of a Slurm job array (tasks.json and slurm-array.sh)"""
+
+    def submit(self, matches: Dict[str, list]) -> None:
+        settings = self.settings
+        # Each element of the Slurm array plays a slice of the matches, several of them in parallel
+        if settings['pack_by'] == 'runtime':
+            # Balance the tasks with the historical durations of the teams, so slow teams do not delay the array
+            estimator = MatchCostEstimator(www_dir=self.contest_manager.www_dir,
+                                           contest_names=self.contest_manager.get_contest_names())
+            num_tasks = settings['tasks'] or math.ceil(len(matches) / max(1, settings['matches_per_task']))
+            tasks, makespan = pack_by_runtime({match_id: estimator.estimate(match_arguments)
+                                               for match_id, match_arguments in matches.items()},
+                                              num_tasks=num_tasks, cpus_per_task=settings['cpus_per_task'])
+            print(f"Predicted makespan: {datetime.timedelta(seconds=round(makespan))} with {len(tasks)} tasks")
+        else:
+            tasks = pack_by_count(list(matches), settings['matches_per_task'])
+        self.contest_manager.dump_tasks_json_file(tasks)
+        self.contest_manager.dump_slurm_array_file(num_tasks=len(tasks), cpus_per_task=settings['cpus_per_task'],
+                                                   task_minutes=get_task_minutes(max(map(len, tasks), default=1),
+                                                                                 settings['cpus_per_task']))
+        print(f"{len(matches)} matches packed into {len(tasks)} tasks, submit slurm-array.sh to play them")
+
+
+class LocalPoolExecutor(MatchExecutor):
+    """The matches are played right away on the local machine, by a pool of worker processes"""
+
+    def submit(self, matches: Dict[str, list]) -> None:
+        results = LocalMatchRunner(jobs=self.settings['jobs'], timeout=self.settings['match_timeout'],
+                                   retries=self.settings['retries'], ledger=MatchLedger()).run(list(matches))
+        # A single process plays all the matches, so it can safely index their results right away
+        www_dir = self.contest_manager.www_dir if self.contest_manager is not None else "www"
+        record_match_results(www_dir=www_dir, matches={match_id: matches[match_id]
+                                                        for match_id, result in results.items() if result.success})
+
+
+class WorkQueueExecutor(MatchExecutor):
+    """
+    The matches are queued in a directory that any number of workers (step worker), on any machines sharing the
+    file system, pull matches from until it is empty.
+    """
+
+    def submit(self, matches: Dict[str, list]) -> None:
+        # The longest matches are queued first, so that none of them is left to start when the others are done
+        estimator = MatchCostEstimator(www_dir=self.contest_manager.www_dir,
+                                       contest_names=self.contest_manager.get_contest_names())
+        WorkQueue(self.settings['queue_dir']).reset(sorted(matches, key=lambda match_id: -estimator.estimate(
+            matches[match_id])))
+        print(f"{len(matches)} matches queued in {self.settings['queue_dir']}, start the workers with: "
+              f"python contest_manager.py -s worker -j <matches at a time> --queue-dir {self.settings['queue_dir']}")
+
+
+EXECUTORS = {
+    'slurm': SlurmArrayExecutor,
+    'local': LocalPoolExecutor,
+    'queue': WorkQueueExecutor,
+}
+
+
 def main():
     logging.basicConfig(level=logging.INFO)
     logging.info(f"Command arguments: {sys.argv}")
-    contest_manager = ContestManager(contests_json_file="contests.json")
     settings = load_settings()
 
     if settings['step'] == 'prepare_matches':
         print('Step 1...')
+        contest_manager = ContestManager(contests_json_file="contests.json")
         for contest_name in contest_manager.get_contest_names():
             all_teams = contest_manager.get_all_teams(contest_name=contest_name)
-            for t1_idx in range(0, len(all_teams)):
-                for t2_idx in range(t1_idx+1, len(all_teams)):
-                # Allow only new vs all (not old vs old)
-                        if not all_teams[t1_idx].get_updated() and not all_teams[t2_idx].get_updated():
-                            continue
-                        new_match = [all_teams[t1_idx], all_teams[t2_idx]]
-                        random.shuffle(new_match)  # randomize blue vs red
-                        if new_match[0].get_syntax_error() == False and new_match[1].get_syntax_error() == False: 
-                            if new_match[0].get_loading_error() == False and new_match[1].get_loading_error() == False: 
-                                contest_manager.submit_match(contest_name=contest_name, blue_team=new_match[0], red_team=new_match[1])
+            # Teams whose agent cannot be loaded do not play
+            playable_teams = {team.get_name(): team for team in all_teams
+                              if not team.get_syntax_error() and not team.get_loading_error()}
+            points, played_pairs, engine = {}, set(), None
+            if settings['format'] in (FORMAT_SWISS, FORMAT_ADAPTIVE):
+                with ResultsStore(contest_dir=os.path.join(contest_manager.www_dir,
+                                                           f"contest_{contest_name}")) as results_store:
+                    results_store.update()
+                    points = {team_name: stats[1] for team_name, stats in results_store.get_teams_stats().items()}
+                    played_pairs = results_store.get_played_pairs()
+                    if settings['format'] == FORMAT_ADAPTIVE:
+                        engine = RatingEngine(results_store.get_ratings())
+            seed = settings['seed'] or f"{contest_name}-{contest_manager.get_last_match_id(contest_name)}"
+            matches = schedule(settings['format'], list(playable_teams), seed=seed,
+                               new_team_names={team_name for team_name, team in playable_teams.items()
+                                               if team.get_updated()},
+                               matches_per_team=settings['matches_per_team'], rounds=settings['swiss_rounds'],
+                               points=points, played_pairs=played_pairs, engine=engine,
+                               budget=settings['matches_budget'])
+            for blue_name, red_name in matches:
+                contest_manager.submit_match(contest_name=contest_name, blue_team=playable_teams[blue_name],
+                                             red_team=playable_teams[red_name])
 
             contest_manager.dump_contest_teams_json_file(contest_name=contest_name, dest_file_name=f"teams_{contest_name}.json")
         contest_manager.dump_contests_json_file()
         contest_manager.dump_matches_json_file()
-        with open("matches.json","r") as f:
-                matches_json = f.read()
-                matches_json = json.loads(matches_json)
-
-        with open('slurm-array-template.sh', 'r') as template:
-            filedata = template.read()
-
-        filedata = filedata.replace('$1', str(len(matches_json)))
-        with open('slurm-array.sh', 'w') as file:
-            file.write(filedata)
+        matches = contest_manager.matches_to_json_obj()
+        MatchLedger().reset(matches)
+        EXECUTORS[settings['executor']](contest_manager, settings).submit(matches)
 
 
     if settings['step']  == 'run_matches':	    
-        with open("matches.json","r") as f:
-            matches = f.read()
-            matches = json.loads(matches)
-            if settings['task'] is not None:  # Cluster - parallel execution
-                print(f"Match #{settings['task']}: args={matches[settings['task']]}")
-                capture.run(matches[settings['task'] ])
-            else:  # CPU - sequential execution
-                for m in matches.items():
-                    print(f"Match #{m[0]}: args={m[1]}")
-                    capture.run(m[1])
+        # Only the matches file is needed: no repository is opened and no agent is loaded by the manager.
+        # The matches already done according to the ledger are skipped, e.g. when a preempted task is run again
+        ledger = MatchLedger()
+        if settings['task'] is not None:  # Cluster - parallel execution
+            if os.path.exists("tasks.json"):
+                task_matches = load_task_matches(settings['task'])
+            else:  # matches prepared before tasks were introduced: one match per task
+                task_matches = [settings['task']]
+            task_matches = ledger.get_unfinished(task_matches)
+            if len(task_matches) == 1:
+                run_match(task_matches[0], ledger=ledger)
+            elif task_matches:
+                LocalMatchRunner(jobs=settings['jobs'], timeout=settings['match_timeout'],
+                                 retries=settings['retries'], ledger=ledger).run(task_matches)
+        else:  # CPU - local pool of workers
+            matches = load_matches()
+            LocalPoolExecutor(contest_manager=None, settings=settings).submit({match_id: matches[match_id]
+                                                      for match_id in ledger.get_unfinished(matches)})
+
+    if settings['step'] == 'worker':
+        # Plays the matches of the work queue until it is empty, several at a time
+        work_queue = WorkQueue(settings['queue_dir'])
+        LocalMatchRunner(jobs=settings['jobs'], timeout=settings['match_timeout'], retries=settings['retries'],
+                         ledger=MatchLedger()).run_pulled(work_queue.claim,
+                                                          on_finished=lambda result: work_queue.release(
+                                                              result.match_id))
 
         
+    if settings['step'] == 'resume':
+        # After a killed or preempted run, only the matches that are not done are submitted again
+        contest_manager = ContestManager(contests_json_file="contests.json", lazy=True)
+        matches = load_matches()
+        ledger = MatchLedger()
+        print(f"Matches: {ledger.get_summary(matches)}")
+        unfinished = ledger.get_unfinished(matches)
+        if unfinished:
+            EXECUTORS[settings['executor']](contest_manager, settings).submit(
+                {match_id: matches[match_id] for match_id in unfinished})
+        else:
+            print("All the matches are done")
+
     if settings['step']  == 'html':	    
-        contest_manager.generate_html()
+        contest_manager = ContestManager(contests_json_file="contests.json", lazy=True)
+        contest_manager.generate_html(page_size=settings['page_size'])
+
+    if settings['step'] == 'archive':
+        # The replays and logs of the finished round are packed, they are still served by the results web server
+        contest_manager = ContestManager(contests_json_file="contests.json", lazy=True)
+        round_id = datetime.datetime.now().strftime("%Y-%m-%dT%H-%M-%S")
+        # Matches of matches.json not done according to the ledger may still be writing their replay and log
+        matches = load_matches() if os.path.exists("matches.json") else {}
+        unfinished_match_ids = {}
+        for match_id in MatchLedger().get_unfinished(matches):
+            contest_name, _, _ = get_match_teams(matches[match_id])
+            unfinished_match_ids.setdefault(contest_name, set()).add(
+                matches[match_id][matches[match_id].index("-m") + 1])
+        for contest_name in contest_manager.get_contest_names():
+            num_packed = pack_round(os.path.join(contest_manager.www_dir, f"contest_{contest_name}"), round_id,
+                                    unfinished_match_ids=unfinished_match_ids.get(contest_name, ()))
+            print(f"Contest {contest_name}: round {round_id} archived, {num_packed}")
 
 
 
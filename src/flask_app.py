@@ -1,37 +1,62 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, abort
 import os
-import json
 from flask import send_file
 
+from match_index import MatchIndex
+import results_api
+
 app = Flask(__name__, static_folder='./www/static', template_folder='./www')
 
-def get_team_names():
-    team_names = set()
-    directories = [
-        './www/contest_upf-ai22/scores',
-        './www/contest_upf-ai23/scores'
-    ]  # Directories for both years
-    for directory in directories:
-        for filename in os.listdir(directory):
-            if filename.startswith('match_') and filename.endswith('.json'):
-                with open(os.path.join(directory, filename), 'r') as file:
-                    data = json.load(file)
-                    for team_name in data['teams_stats']:
-                        team_names.add(team_name)
-    return list(team_names)
+# Results of all the contests of contests.json, loaded once and refreshed when their results stores change
+match_index = MatchIndex(www_dir='./www', contests_json_file='contests.json')
+match_index.load()
 
-@app.route('/download/<year>/<file_type>/<file_name>')
-def download_file(year, file_type, file_name):
-    # Get current working directory
-    current_dir = os.getcwd()
-    # Construct file paths from the current working directory
-    file_path = os.path.join(current_dir, f'www/contest_upf-ai{year}/{file_type}s/{file_name}')
-    print(file_path)
-    return send_file(file_path, as_attachment=True)
+def get_contest_name(year):
+    """Contests are selected by name, or by year for the upf-ai<year> contests"""
+    return results_api.get_contest_name(request.args, year)
+
+def get_contest(year):
+    contest = match_index.get_contest(get_contest_name(year))
+    if contest is None:
+        abort(404)
+    return contest
+
+def get_team_names():
+    return results_api.get_all_team_names(match_index)
 
+# Behind nginx or Apache, the files can be sent by the front server (X-Sendfile) instead of by the application
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
 
+# Indexes of the archived replays and logs, by contest directory
+archive_indexes = {}
 
+def send_download(download):
+    """
+    Sends a file as an attachment, with support for conditional and range requests. Files sent as they are stored go
+    through the sendfile path of the server, the others (archived, or decompressed for the clients not accepting
+    gzip) are read by the application.
+    """
+    if download.etag is None:
+        response = send_file(download.path, mimetype=download.mimetype, as_attachment=True,
+                             download_name=download.file_name, conditional=True,
+                             max_age=results_api.DOWNLOAD_MAX_AGE)
+    elif download.is_not_modified(request.headers):
+        response = app.response_class(status=304)
+    else:
+        # The validators are set before make_conditional, which checks them for If-Range
+        response = app.response_class(download.read(), mimetype=download.mimetype, headers=download.get_headers())
+        response.headers.set('Content-Disposition', 'attachment', filename=download.file_name)
+        return response.make_conditional(request, accept_ranges=True, complete_length=response.content_length)
+    response.headers.update(download.get_headers())
+    return response
 
+@app.route('/download/<year>/<file_type>/<file_name>')
+def download_file(year, file_type, file_name):
+    download = results_api.get_download(match_index, archive_indexes, get_contest_name(year), file_type, file_name,
+                                        accepts_gzip='gzip' in request.accept_encodings)
+    if download is None:
+        abort(404)
+    return send_download(download)
 
 
 @app.route('/tournament')
@@ -39,49 +64,31 @@ def tournament_page():
     team_names = get_team_names()
     return render_template('results_0_template.html', team_names=team_names)
 
+def send_query(contest, get_body):
+    """JSON response of a query on the index of a contest, empty (304) if the copy of the client is still valid"""
+    result = results_api.answer_query(contest, request.args.items(multi=True), request.headers, get_body)
+    response = app.response_class(status=304) if result.body is None else jsonify(result.body)
+    response.headers.update(result.headers)
+    return response
+
 @app.route('/get_matches')
 def get_matches():
-    selected_team = request.args.get('team_name')
     selected_year = request.args.get('year')  # Get the selected year
-    matches = []
-    directory = f'./www/contest_upf-ai{selected_year}/scores'  # Construct pathways based on year
-    for filename in os.listdir(directory):
-        if filename.startswith('match_') and filename.endswith('.json'):
-            with open(os.path.join(directory, filename), 'r') as file:
-                data = json.load(file)
-                for game in data['games']:
-                    if selected_team in game[:2]:
-                        # Add the correct suffix based on the file type
-                        score_file = filename
-                        replay_file = filename.replace('.json', '.replay')
-                        log_file = filename.replace('.json', '.log')
-                        match = {
-                            'team1': game[0],
-                            'team2': game[1],
-                            'layout': game[2],
-                            'time': game[3],
-                            'score': game[5],
-                            'winner': game[0] if game[5] > 0 else game[1],
-                            'score_file': f"/download/{selected_year}/score/{score_file}",
-                            'replay_file': f"/download/{selected_year}/replay/{replay_file}",
-                            'log_file': f"/download/{selected_year}/log/{log_file}"
-                        }
-                        matches.append(match)
-    return jsonify({'matches': matches})
+    contest = get_contest(selected_year)
+    return send_query(contest, lambda: results_api.get_matches(contest, selected_year, request.args))
+
+
+@app.route('/get_ranking')
+def get_ranking():
+    contest = get_contest(request.args.get('year'))
+    return send_query(contest, lambda: results_api.get_ranking(contest))
 
 
 @app.route('/get_teams')
 def get_teams():
     selected_year = request.args.get('year')
-    directory = f'./www/contest_upf-ai{selected_year}/scores'
-    team_names = set()
-    for filename in os.listdir(directory):
-        if filename.startswith('match_') and filename.endswith('.json'):
-            with open(os.path.join(directory, filename), 'r') as file:
-                data = json.load(file)
-                for team_name in data['teams_stats']:
-                    team_names.add(team_name)
+    team_names = get_contest(selected_year).get_team_names()
     return jsonify({'teams': list(team_names)})
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -13,16 +13,42 @@ __license__ = "GPLv3"
 import os
 import sys
 import argparse
-import json
 import shutil
-import zipfile
 import logging
 import re
+import math
+import contextlib
+import hashlib
+import json
 import datetime
+import urllib.parse
+
+from json_files import dump_json
+from match_archive import ArchiveIndex, list_archives
+from replay_storage import COMPRESSED_SUFFIX, find_stored_file
+from results_store import ResultsStore
+from static_assets import StaticAssetsDeployer
 
 logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO,
                     datefmt='%a, %d %b %Y %H:%M:%S')
 
+DEFAULT_PAGE_SIZE = 500
+MANIFEST_FILE_NAME = "html_manifest.json"
+# Team pages written at the same time, well below the usual limit of 1024 open files per process
+MAX_OPEN_TEAM_PAGES = 256
+
+
+def invalidate_runs(www_dir: str) -> None:
+    """Makes the next generation regenerate all the runs, e.g. after their replays and logs were stored differently"""
+    manifest_file = os.path.join(www_dir, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_file):
+        return
+    with open(manifest_file, "r") as f:
+        manifest = json.load(f)
+    manifest["runs"] = {}
+    dump_json(manifest, manifest_file, sort_keys=True, indent=4)
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 # Load settings either from config.json or from the command line
 
@@ -46,10 +72,16 @@ def load_settings():
         dest="contest", type=str, default="contest_default",
         help='output directory containing scores, replays, and log files'
     )
+    parser.add_argument(
+        "-p", "--page-size",
+        dest="page_size", type=int, default=DEFAULT_PAGE_SIZE,
+        help='number of games per page of the games list'
+    )
     args = parser.parse_args()
 
     # First get the options from the configuration file if available
-    settings = {'organizer': args.organizer, 'www_dir': args.www_dir, 'contest': args.contest}
+    settings = {'organizer': args.organizer, 'www_dir': args.www_dir, 'contest': args.contest,
+                'page_size': args.page_size}
 
     logging.info(f'HTML settings: {settings}')
 
@@ -58,34 +90,100 @@ def load_settings():
 
 # ----------------------------------------------------------------------------------------------------------------------
 
+class _PageWriter:
+    """
+    Writes a page to a temporary file while hashing it, and only replaces the page if its content changed.
+    The replacement is atomic, so the web server never serves a half-written page.
+    """
+
+    def __init__(self, path: str, pages_hashes: dict, page_name: str):
+        self.path = path
+        self.pages_hashes = pages_hashes
+        self.page_name = page_name
+        self.replaced = False
+        self.tmp_path = f"{path}.tmp"
+        self.file = open(self.tmp_path, "w")
+        self.digest = hashlib.sha1()
+
+    def write(self, text: str) -> None:
+        self.file.write(text)
+        self.digest.update(text.encode())
+
+    def writelines(self, lines) -> None:
+        for text in lines:
+            self.write(text)
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+        self.file.close()
+        content_hash = self.digest.hexdigest()
+        if content_hash == self.pages_hashes.get(self.page_name) and os.path.exists(self.path):
+            os.remove(self.tmp_path)
+        else:
+            os.replace(self.tmp_path, self.path)
+            self.pages_hashes[self.page_name] = content_hash
+            self.replaced = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            # The page may have been closed, and its temporary file renamed or removed, before the error
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.tmp_path)
+
+
 class HtmlGenerator:
     www_dir: str
+    page_size: int
     font_source: str
     file_fonts: str
     file_css: str
 
-    def __init__(self, www_dir: str, font_source: str = "."):
+    def __init__(self, www_dir: str, font_source: str = ".", page_size: int = DEFAULT_PAGE_SIZE):
         """
         Initializes this generator.
 
         :param www_dir: the output path
         :param font_source: path to HTML sources
+        :param page_size: number of games per page of the games list
         """
         self.www_dir = www_dir
+        self.page_size = max(1, page_size)
+        self.manifest_file = os.path.join(self.www_dir, MANIFEST_FILE_NAME)
         self.font_source = font_source
         self.file_fonts = os.path.join(self.font_source, "fonts.zip")
         self.file_css = os.path.join(self.font_source, "style.css")
         self.error_score = 9999
+        self._archive_indexes = {}  # by contest directory
 
-        # Preparing fonts and style
-        os.makedirs(f"{self.www_dir}", exist_ok=True)
-        contest_zip_file = zipfile.ZipFile(self.file_fonts)
-        contest_zip_file.extractall(self.www_dir)
-        shutil.copy(self.file_css, self.www_dir)
+        # Preparing fonts and style, only if they changed since the last time
+        StaticAssetsDeployer(source_dir=self.font_source, www_dir=self.www_dir).deploy()
 
     def _close(self):
         pass
 
+    def _load_manifest(self) -> dict:
+        """
+        The manifest records the content hash of every page and, for every run, the version of the results it
+        was generated from.
+        """
+        if not os.path.exists(self.manifest_file):
+            return {"pages": {}, "runs": {}}
+        with open(self.manifest_file, "r") as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest: dict) -> None:
+        dump_json(manifest, self.manifest_file, sort_keys=True, indent=4)
+
+    def _open_page(self, manifest: dict, page_name: str) -> _PageWriter:
+        return _PageWriter(os.path.join(self.www_dir, page_name), manifest["pages"], page_name)
+
     def clean_up(self):
         """
         Empties and removes the output directory
@@ -102,13 +200,23 @@ class HtmlGenerator:
         logs_dir = os.path.join(self.www_dir, f"contest_{contest_name}/logs")
         errors_dir = os.path.join(self.www_dir, f"contest_{contest_name}/errors")
 
+        manifest = self._load_manifest()
+        # The indexes of the archives are loaded again for every generation
+        self._archive_indexes = {}
         self._save_run_html(organizer=organizer, run_id=run_id, scores_dir=scores_dir, replays_dir=replays_dir,
-                            logs_dir=logs_dir, errors_dir=errors_dir)
-        self._generate_main_html()
+                            logs_dir=logs_dir, errors_dir=errors_dir, manifest=manifest)
+        self._generate_main_html(manifest=manifest)
+        self._save_manifest(manifest)
 
-    def _save_run_html(self, organizer: str, run_id: int, scores_dir: str, replays_dir: str, logs_dir: str, errors_dir: str):
+    def _save_run_html(self, organizer: str, run_id: int, scores_dir: str, replays_dir: str, logs_dir: str,
+                       errors_dir: str, manifest: dict):
         """
-        Generates the HTML of a contest run and saves it in www/results_<run_id>/results.html.
+        Generates the HTML of a contest run and saves it in www/results_<run_id>.html (standings), plus the pages
+        www/results_<run_id>_games_<page>.html (list of games) and www/results_<run_id>_team_<team>.html (games of
+        each team).
+
+        Nothing is generated if the results did not change since the last time, only the pages of the teams whose
+        matches were added or deleted are regenerated, and pages are only replaced if their content changed.
 
         The URLs passed should be either:
          - HTTP URLs, in which case the scores file is downloaded to generate the HTML
@@ -116,54 +224,154 @@ class HtmlGenerator:
 
         No checks are done, so mind your parameters.
         """
-        random_layouts, fixed_layouts, max_steps = None, None, None
-        games = []
-        teams_stats = {}
-        # Collect all files in scores directory
-        all_files = [f for f in os.listdir(scores_dir) if os.path.isfile(os.path.join(scores_dir, f))]
-
-        # Process each score file - 1 per contest ran
-        pattern = re.compile(r'match_([-+\dT:.]+)\.json')
-        for score_filename in all_files:
-            match = pattern.match(score_filename)
-            if not match:
-                continue
-
-            # Extract the id for that particular content from the score file match_{id}.score
-            match_id = match.group(1)
+        # Only the score files added since the last run are parsed
+        with ResultsStore(contest_dir=os.path.dirname(scores_dir)) as results_store:
+            results_store.update()
+            # The links to the replays and logs depend on whether they are archived
+            run_key = {"contest_dir": os.path.dirname(scores_dir), "organizer": organizer, "page_size": self.page_size,
+                       "store_id": results_store.get_id(), "last_change": results_store.get_last_change(),
+                       "errors": sorted(os.listdir(errors_dir)) if os.path.isdir(errors_dir) else [],
+                       "archives": list_archives(os.path.dirname(scores_dir))}
+            previous_run_key = manifest["runs"].get(str(run_id))
+            if previous_run_key == run_key and os.path.exists(os.path.join(self.www_dir, self._get_page_name(run_id))):
+                logging.info(f"Results of run {run_id} did not change, HTML not regenerated")
+                return
+            teams_to_render = None  # all of them
+            if previous_run_key is not None and all(previous_run_key[key] == run_key[key]
+                                                    for key in ("contest_dir", "page_size", "store_id", "archives")):
+                teams_to_render = results_store.get_changed_teams(since_change=previous_run_key["last_change"])
 
-            with open(os.path.join(scores_dir, score_filename), 'r') as f:
-                match_data = json.load(f)
-
-            games.extend(match_data['games'])
             # points_pct, points, wins, draws, losses, errors, sum_score
-            # team_stats = {'Blue_team': [6, 2, 0, 0, 2, 2], 'Red_team': [0, 0, 0, 2, 2, -2]}  # data['team_stats']
-            for team_name, data in match_data['teams_stats'].items():
-                if team_name in teams_stats:
-                    prev_data = teams_stats[team_name]
-                    data = [a+b for (a, b) in zip(data, prev_data)]  # add the content of old and new data
-                teams_stats.update({team_name: data})
-
-            if max_steps is None:
-                max_steps = match_data['max_steps']
-                random_layouts = [layout for layout in match_data['layouts'] if layout.startswith('RANDOM')]
-                fixed_layouts = [layout for layout in match_data['layouts'] if not layout.startswith('RANDOM')]
-
-        num_matches_per_team = (len(teams_stats) - 1)
-        for team_name, data in teams_stats.items():
-            data[0] = data[0]//num_matches_per_team  # averaging the percentage of points
-            teams_stats.update({team_name: data})
-
-        date_run = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-
-        run_html = self._generate_html_result(run_id, date_run, organizer, games, teams_stats, random_layouts,
-                                              fixed_layouts, max_steps, scores_dir, replays_dir, logs_dir, errors_dir)
+            teams_stats = results_store.get_teams_stats()
+            max_steps, layouts = results_store.get_settings()
+            games_summary, teams_layouts = self._summarize_games(results_store.iter_games())
+            random_layouts = [layout for layout in layouts if layout.startswith('RANDOM')]
+            fixed_layouts = [layout for layout in layouts if not layout.startswith('RANDOM')]
+
+            ratings = results_store.get_ratings()
+
+            date_run = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+
+            # The pages are written while they are generated, with the games read one by one from the store
+            with self._open_page(manifest, self._get_page_name(run_id)) as f:
+                f.writelines(self._generate_html_result(run_id, date_run, organizer, games_summary, teams_stats,
+                                                        ratings, random_layouts, fixed_layouts, max_steps,
+                                                        errors_dir))
+                f.write("\n")
+            written_pages = self._save_games_pages(run_id, results_store.iter_games, games_summary, teams_layouts,
+                                                   scores_dir, replays_dir, logs_dir, manifest, teams_to_render)
+            written_pages.add(self._get_page_name(run_id))
+            # The pages of the teams that were not affected are still valid
+            written_pages.update(self._get_page_name(run_id, team_name=team_name) for team_name in teams_layouts)
+            manifest["runs"][str(run_id)] = run_key
+
+        # Remove the pages of teams or games that are not in the run anymore
+        for file_name in os.listdir(self.www_dir):
+            if file_name.startswith(f"results_{run_id}_") and file_name not in written_pages:
+                os.remove(os.path.join(self.www_dir, file_name))
+                manifest["pages"].pop(file_name, None)
+
+    @staticmethod
+    def _get_page_name(run_id, games_page: int = None, team_name: str = None) -> str:
+        if games_page is not None:
+            return f"results_{run_id}_games_{games_page}.html"
+        if team_name is not None:
+            return f"results_{run_id}_team_{re.sub(r'[^A-Za-z0-9_.-]', '_', team_name)}.html"
+        return f"results_{run_id}.html"
+
+    def _summarize_games(self, games):
+        """
+        Computes, in one pass over the games, the number of games, the sum and the max of their durations, and the
+        games played, won, tied and lost by each team in each layout.
+        """
+        num_games, sum_times, max_time = 0, 0, 0
+        teams_layouts = {}
+        for (n1, n2, layout, score, winner, time_taken, match_id) in games:
+            num_games += 1
+            sum_times += time_taken
+            max_time = max(max_time, time_taken)
+            for team_name, opponent in ((n1, n2), (n2, n1)):
+                # played, won, tied, lost
+                layout_stats = teams_layouts.setdefault(team_name, {}).setdefault(layout, [0, 0, 0, 0])
+                layout_stats[0] += 1
+                if winner == team_name:
+                    layout_stats[1] += 1
+                elif winner == opponent:
+                    layout_stats[3] += 1
+                else:
+                    layout_stats[2] += 1
+        return (num_games, sum_times, max_time), teams_layouts
 
-        html_full_path = os.path.join(self.www_dir, f'results_{run_id}.html')
-        with open(html_full_path, "w") as f:
-            print(run_html, file=f)
+    def _save_games_pages(self, run_id, get_games, games_summary, teams_layouts, scores_dir, replays_dir, logs_dir,
+                          manifest, teams_to_render=None):
+        """
+        Writes the paginated list of games and the page of each team while passing over the games. The team pages
+        are written in batches of MAX_OPEN_TEAM_PAGES, one pass over the games per batch (the list of games is written
+        in the first one), so the number of files open at the same time does not grow with the number of teams.
 
-    def _generate_main_html(self):
+        :param get_games: returns an iterator over the games, called once per pass
+        :param teams_to_render: teams whose page must be regenerated, None for all
+        :return: the names of the pages written
+        """
+        num_pages = max(1, math.ceil(games_summary[0] / self.page_size))
+        written_pages = set()
+        num_written = 0
+        num_replaced = 0
+        team_names = [team_name for team_name in sorted(teams_layouts)
+                      if teams_to_render is None or team_name in teams_to_render]
+        batches = [team_names[start:start + MAX_OPEN_TEAM_PAGES]
+                   for start in range(0, len(team_names), MAX_OPEN_TEAM_PAGES)] or [[]]
+        for batch_number, batch in enumerate(batches):
+            write_games_list = batch_number == 0
+            batch = set(batch)
+            with contextlib.ExitStack() as stack:
+                def open_page(page_name, title):
+                    page = stack.enter_context(self._open_page(manifest, page_name))
+                    page.write(self._generate_page_header(title))
+                    written_pages.add(page_name)
+                    return page
+
+                def close_page(page):
+                    nonlocal num_written, num_replaced
+                    page.write(self._generate_page_footer())
+                    page.close()
+                    num_written += 1
+                    num_replaced += page.replaced
+
+                games_page = None
+                team_pages = {}
+                for index, game in enumerate(get_games()):
+                    game_teams = [team_name for team_name in dict.fromkeys(game[:2]) if team_name in batch]
+                    if not write_games_list and not game_teams:
+                        continue
+                    row = self._generate_game_row(game, scores_dir, replays_dir, logs_dir)
+                    if write_games_list:
+                        if index % self.page_size == 0:
+                            if games_page is not None:
+                                close_page(games_page)
+                            page_number = index // self.page_size + 1
+                            games_page = open_page(self._get_page_name(run_id, games_page=page_number),
+                                                   f"Games (page {page_number} of {num_pages})")
+                            games_page.write(self._generate_pages_navigation(run_id, num_pages, page_number))
+                            games_page.writelines(self._generate_games_table_header())
+                        games_page.write(row)
+                    for team_name in game_teams:
+                        if team_name not in team_pages:
+                            team_page = open_page(self._get_page_name(run_id, team_name=team_name),
+                                                  f"Team {team_name}")
+                            team_page.write(f"""<a href="{self._get_page_name(run_id)}">Standings</a>\n""")
+                            team_page.writelines(self._generate_team_layouts_table(teams_layouts[team_name]))
+                            team_page.write("\n\n<br/><br/><h2>Games</h2>\n")
+                            team_page.writelines(self._generate_games_table_header())
+                            team_pages[team_name] = team_page
+                        team_pages[team_name].write(row)
+                for page in ([games_page] if games_page is not None else []) + list(team_pages.values()):
+                    close_page(page)
+        logging.info(f"Run {run_id}: {num_replaced} of {num_written} games/team pages regenerated were replaced "
+                     f"({len(team_names)} teams affected)")
+        return written_pages
+
+    def _generate_main_html(self, manifest: dict):
         """
         Generates the index HTML, containing links to the HTML files of all the runs.
         The file is saved in www/index.html.
@@ -176,26 +384,27 @@ class HtmlGenerator:
         for d in sorted(os.listdir(self.www_dir)):
             if d.endswith('fonts'):
                 continue
-            if not d.startswith('results'):
+            if not re.fullmatch(r'results_[^_]+\.html', d):  # skip the games and team pages of the runs
                 continue
             main_html += f"""<a href="{d}"> {d[:-5]}  </a> <br/>\n"""
         main_html += "\n\n<br/></body></html>"
-        with open(os.path.join(self.www_dir, 'index.html'), "w") as f:
-            print(main_html, file=f)
-
-    def _generate_ranking(self, team_stats):
-        output = """<tr>"""
-        output += """<th>Position</th>"""
-        output += """<th>Team</th>"""
-        output += """<th>Points %</th>"""
-        output += """<th>Points</th>"""
-        output += """<th>Win</th>"""
-        output += """<th>Tie</th>"""
-        output += """<th>Lost</th>"""
-        output += """<th>TOTAL</th>"""
-        output += """<th>FAILED</th>"""
-        output += """<th>Score Balance</th>"""
-        output += """</tr>\n"""
+        with self._open_page(manifest, 'index.html') as f:
+            f.write(main_html + "\n")
+
+    def _generate_ranking(self, run_id, team_stats, ratings):
+        yield """<tr>"""
+        yield """<th>Position</th>"""
+        yield """<th>Team</th>"""
+        yield """<th>Points %</th>"""
+        yield """<th>Points</th>"""
+        yield """<th>Win</th>"""
+        yield """<th>Tie</th>"""
+        yield """<th>Lost</th>"""
+        yield """<th>TOTAL</th>"""
+        yield """<th>FAILED</th>"""
+        yield """<th>Score Balance</th>"""
+        yield """<th>Rating</th>"""
+        yield """</tr>\n"""
 
         # Sort teams by points_pct v[1][0] first, then no. of wins, then score points.
         # example list(team_stats.items() = [('Blue_team', [6, 2, 0, 0, 2, 2]), ('Red_team', [0, 0, 0, 2, 2, -2])]
@@ -204,182 +413,236 @@ class HtmlGenerator:
         position = 0
         for key, (points_pct, points, wins, draws, losses, errors, sum_score) in sorted_team_stats:
             position += 1
-            output += """<tr>"""
-            output += f"""<td>{position}</td>"""
-            output += f"""<td>{key}</td>"""
-            output += f"""<td>{points_pct}%</td>"""
-            output += f"""<td>{points}</td>"""
-            output += f"""<td>{wins}</td>"""
-            output += f"""<td >{draws}</td>"""
-            output += f"""<td>{losses}</td>"""
-            output += f"""<td>{(wins + draws + losses)}</td>"""
-            output += f"""<td >{errors}</td>"""
-            output += f"""<td >{sum_score}</td>"""
-            output += f"""</tr>\n"""
-        output += "</table>"
-        return output
+            yield """<tr>"""
+            yield f"""<td>{position}</td>"""
+            yield f"""<td><a href="{self._get_page_name(run_id, team_name=key)}">{key}</a></td>"""
+            yield f"""<td>{points_pct}%</td>"""
+            yield f"""<td>{points}</td>"""
+            yield f"""<td>{wins}</td>"""
+            yield f"""<td >{draws}</td>"""
+            yield f"""<td>{losses}</td>"""
+            yield f"""<td>{(wins + draws + losses)}</td>"""
+            yield f"""<td >{errors}</td>"""
+            yield f"""<td >{sum_score}</td>"""
+            rating = ratings.get(key)
+            # The true rating is within two deviations of the rating with a 95% probability
+            yield f"""<td>{rating.rating:.0f} &plusmn; {2 * rating.deviation:.0f}</td>""" if rating else "<td></td>"
+            yield f"""</tr>\n"""
+        yield "</table>"
         
     def _generate_disqualified_table(self, errors_dir):
-        output = "<h2>Disqualified</h2>\n"
+        yield "<h2>Disqualified</h2>\n"
 
-        output += f"<h3>Disqualified teams</h3>"
+        yield f"<h3>Disqualified teams</h3>"
 
 
-        output += """<table border="1">"""
-        output += """<tr>"""
-        output += """<th>Team</th>"""
-        output += """<th>Log file</th>"""
-        output += """</tr>\n"""
+        yield """<table border="1">"""
+        yield """<tr>"""
+        yield """<th>Team</th>"""
+        yield """<th>Log file</th>"""
+        yield """</tr>\n"""
         disqualified_teams = os.listdir(errors_dir)
         for team in disqualified_teams:
-            output += """<tr>"""
+            yield """<tr>"""
 
             # Team 1
-            output += """<td align="center">"""
-            output += f"<b>{team}</b>"
+            yield """<td align="center">"""
+            yield f"<b>{team}</b>"
             
             # Logs file
             logs_filename = f"{team}" 
             logs_file_path = os.path.join(errors_dir[4:], team)
-            output += "<td align=\"center\">"
-            output += f"<a href=\"{logs_file_path}\">{logs_filename}</a>\n"
-            output += "</td>"
+            yield "<td align=\"center\">"
+            yield f"<a href=\"{logs_file_path}\">{logs_filename}</a>\n"
+            yield "</td>"
+
+            yield """</tr>\n"""
+        yield "</table>"
 
-            output += """</tr>\n"""
-        output += "</table>"
+    @staticmethod
+    def _generate_page_header(title):
+        output = f"""<html><head><title>{title}</title>\n"""
+        output += """<link rel="stylesheet" type="text/css" href="style.css"/></head>\n"""
+        output += f"""<body><h1>{title}</h1>\n"""
         return output
 
-    def _generate_matches_table(self, games, scores_dir, replays_dir, logs_dir):
-        output = "<h2>Games</h2>\n"
+    @staticmethod
+    def _generate_page_footer():
+        return "\n\n</table></body></html>\n"
 
-        g_times = [g_time for (_, _, _, _, _, g_time, _) in games]
-        output += f"<h3>No. of games: {len(games)} / "
-        output += f"Avg. game length: {str(datetime.timedelta(seconds=round(sum(g_times) / len(g_times), 0)))} / "
-        output += f"Max game length: {datetime.timedelta(seconds=max(g_times))}</h3>\n\n"
+    def _generate_pages_navigation(self, run_id, num_pages, current_page=None):
+        output = f"""<p><a href="{self._get_page_name(run_id)}">Standings</a> | Pages:"""
+        for page_number in range(1, num_pages + 1):
+            if page_number == current_page:
+                output += f""" <b>{page_number}</b>"""
+            else:
+                output += f""" <a href="{self._get_page_name(run_id, games_page=page_number)}">{page_number}</a>"""
+        output += "</p>\n"
+        return output
 
+    @staticmethod
+    def _generate_team_layouts_table(layouts_stats):
+        yield "<h2>Results by layout</h2>\n"
+        yield """<table border="1">"""
+        yield """<tr><th>Layout</th><th>Played</th><th>Win</th><th>Tie</th><th>Lost</th><th>Win %</th></tr>\n"""
+        for layout, (played, wins, draws, losses) in sorted(layouts_stats.items()):
+            yield f"""<tr><td>{layout}</td><td>{played}</td><td>{wins}</td><td>{draws}</td><td>{losses}</td>"""
+            yield f"""<td>{(100 * wins) // played}%</td></tr>\n"""
+        yield "</table>"
+
+    def _generate_games_summary(self, run_id, games_summary):
+        yield "<h2>Games</h2>\n"
+
+        num_games, sum_times, max_time = games_summary
+        yield f"<h3>No. of games: {num_games} / "
+        yield f"Avg. game length: {str(datetime.timedelta(seconds=round(sum_times / num_games, 0)))} / "
+        yield f"Max game length: {datetime.timedelta(seconds=max_time)}</h3>\n\n"
+        yield self._generate_pages_navigation(run_id, max(1, math.ceil(num_games / self.page_size)))
+
+    @staticmethod
+    def _generate_games_table_header():
+        yield """<table border="1">"""
+        yield """<tr>"""
+        yield """<th>Team 1</th>"""
+        yield """<th>Team 2</th>"""
+        yield """<th>Layout</th>"""
+        yield """<th>Time</th>"""
+        yield """<th>Score</th>"""
+        yield """<th>Winner</th>"""
+        yield """<th>Score file</th>"""
+        yield """<th>Replay file</th>"""
+        yield """<th>Log file</th>"""
+        yield """</tr>\n"""
+
+    def _get_file_link(self, files_dir, file_name):
+        """
+        Link of a replay or log: compressed if it is stored compressed, and through the download route of the results
+        web server if it is packed in the archive of a round (see match_archive.py), as it is not a file anymore
+        """
+        stored_path, _ = find_stored_file(os.path.join(files_dir, file_name))
+        link_dir = files_dir[4:] if files_dir.startswith("www/") else files_dir
+        if stored_path:
+            return os.path.join(link_dir, os.path.basename(stored_path))
+        contest_dir, files_dir_name = os.path.split(os.path.normpath(files_dir))
+        if contest_dir not in self._archive_indexes:
+            # The archives do not change during a generation, their indexes are loaded once
+            self._archive_indexes[contest_dir] = ArchiveIndex(contest_dir, auto_refresh=False)
+        archive_index = self._archive_indexes[contest_dir]
+        if archive_index.find(files_dir_name, file_name) or archive_index.find(files_dir_name,
+                                                                              f"{file_name}{COMPRESSED_SUFFIX}"):
+            # The contest is selected by name, the year of the route is then ignored
+            contest_name = urllib.parse.quote(os.path.basename(contest_dir)[len("contest_"):])
+            return f"/download/{contest_name}/{files_dir_name[:-1]}/{file_name}?contest={contest_name}"
+        return os.path.join(link_dir, file_name)
+
+    def _generate_game_row(self, game, scores_dir, replays_dir, logs_dir):
+        (n1, n2, layout, score, winner, time_taken, match_id) = game
         score_dir = (scores_dir[4:] if scores_dir.startswith("www/") else scores_dir)
-        replays_dir = (replays_dir[4:] if replays_dir.startswith("www/") else replays_dir)
-        logs_dir = (logs_dir[4:] if logs_dir.startswith("www/") else logs_dir)
-
-
-        output += """<table border="1">"""
-        output += """<tr>"""
-        output += """<th>Team 1</th>"""
-        output += """<th>Team 2</th>"""
-        output += """<th>Layout</th>"""
-        output += """<th>Time</th>"""
-        output += """<th>Score</th>"""
-        output += """<th>Winner</th>"""
-        output += """<th>Score file</th>"""
-        output += """<th>Replay file</th>"""
-        output += """<th>Log file</th>"""
-        output += """</tr>\n"""
 
-        for (n1, n2, layout, score, winner, time_taken, match_id) in games:
-            output += """<tr>"""
+        row = ["""<tr>"""]
 
-            # Team 1
-            output += """<td align="center">"""
-            if winner == n1:
-                output += f"<b>{n1}</b>"
-            else:
-                output += f"{n1}"
-            output += """</td>"""
+        # Team 1
+        row.append("""<td align="center">""")
+        if winner == n1:
+            row.append(f"<b>{n1}</b>")
+        else:
+            row.append(f"{n1}")
+        row.append("""</td>""")
 
-            # Team 2
-            output += """<td align="center">"""
-            if winner == n2:
-                output += f"<b>{n2}</b>"
-            else:
-                output += f"{n2}"
-            output += """</td>"""
-
-            # Layout
-            output += f"""<td>{layout}</td>"""
-
-            # Time taken in the game
-            output += f"""<td>{datetime.timedelta(seconds=time_taken)}</td>"""
-
-            # Score and Winner
-            if score == self.error_score:
-                if winner == n1:
-                    output += """<td >--</td>"""
-                    output += f"""<td><b>ONLY FAILED: {n2}</b></td>"""
-                elif winner == n2:
-                    output += """<td >--</td>"""
-                    output += f"""<td><b>ONLY FAILED: {n1}</b></td>"""
-                else:
-                    output += """<td >--</td>"""
-                    output += """<td><b>FAILED BOTH</b></td>"""
-            else:
-                output += f"""<td>{score}</td>"""
-                output += f"""<td><b>{winner}</b></td>"""
-
-            # Score file
-            score_filename = f"match_{match_id}.json"  # ToDo: possible multiple games in a match
-            score_file_path = os.path.join(score_dir, score_filename)
-            output += "<td align=\"center\">"
-            output += f"<a href=\"{score_file_path}\">{score_filename}</a>\n"
-            output += "</td>"
-
-            # Replay file
-            replay_filename = f"match_{match_id}.replay"  # ToDo: possible multiple games in a match
-            replay_file_path = os.path.join(replays_dir, replay_filename)
-            output += "<td align=\"center\">"
-            output += f"<a href=\"{replay_file_path}\">{replay_filename}</a>\n"
-            output += "</td>"
+        # Team 2
+        row.append("""<td align="center">""")
+        if winner == n2:
+            row.append(f"<b>{n2}</b>")
+        else:
+            row.append(f"{n2}")
+        row.append("""</td>""")
 
-            # Logs file
-            logs_filename = f"match_{match_id}.log"  # ToDo: possible multiple games in a match
-            logs_file_path = os.path.join(logs_dir, logs_filename)
-            output += "<td align=\"center\">"
-            output += f"<a href=\"{logs_file_path}\">{logs_filename}</a>\n"
-            output += "</td>"
+        # Layout
+        row.append(f"""<td>{layout}</td>""")
 
-            output += """</tr>\n"""
-        return output
+        # Time taken in the game
+        row.append(f"""<td>{datetime.timedelta(seconds=time_taken)}</td>""")
 
-    def _generate_html_result(self, run_id, date_run, organizer, games, team_stats, random_layouts, fixed_layouts,
-                              max_steps, scores_dir, replays_dir, logs_dir, errors_dir):
+        # Score and Winner
+        if score == self.error_score:
+            if winner == n1:
+                row.append("""<td >--</td>""")
+                row.append(f"""<td><b>ONLY FAILED: {n2}</b></td>""")
+            elif winner == n2:
+                row.append("""<td >--</td>""")
+                row.append(f"""<td><b>ONLY FAILED: {n1}</b></td>""")
+            else:
+                row.append("""<td >--</td>""")
+                row.append("""<td><b>FAILED BOTH</b></td>""")
+        else:
+            row.append(f"""<td>{score}</td>""")
+            row.append(f"""<td><b>{winner}</b></td>""")
+
+        # Score file
+        score_filename = f"match_{match_id}.json"  # ToDo: possible multiple games in a match
+        score_file_path = os.path.join(score_dir, score_filename)
+        row.append("<td align=\"center\">")
+        row.append(f"<a href=\"{score_file_path}\">{score_filename}</a>\n")
+        row.append("</td>")
+
+        # Replay file
+        replay_filename = f"match_{match_id}.replay"  # ToDo: possible multiple games in a match
+        replay_file_path = self._get_file_link(replays_dir, replay_filename)
+        row.append("<td align=\"center\">")
+        row.append(f"<a href=\"{replay_file_path}\">{replay_filename}</a>\n")
+        row.append("</td>")
+
+        # Logs file
+        logs_filename = f"match_{match_id}.log"  # ToDo: possible multiple games in a match
+        logs_file_path = self._get_file_link(logs_dir, logs_filename)
+        row.append("<td align=\"center\">")
+        row.append(f"<a href=\"{logs_file_path}\">{logs_filename}</a>\n")
+        row.append("</td>")
+
+        row.append("""</tr>\n""")
+        return "".join(row)
+
+    def _generate_html_result(self, run_id, date_run, organizer, games_summary, team_stats, ratings,
+                              random_layouts, fixed_layouts, max_steps, errors_dir):
         """
-        Generates the HTML of the report of the run.
+        Generates the HTML of the standings of the run, piece by piece.
+
+        :param games_summary: number of games, sum and max of their durations
+        :param ratings: rating of each team, see ratings.py
         """
-        output = """<html><head><title>Results for the tournament round</title>\n"""
-        output += """<link rel="stylesheet" type="text/css" href="style.css"/></head>\n"""
-        output += """<body><h1>PACMAN Capture the Flag Tournament</h1>\n"""
-        output += f"""<h2>Tournament Organizer: {organizer} </h2>\n"""
-        output += f"""<h3>Name of Tournament: {run_id} </h3>\n"""
-        output += f"""<h3>Date of Tournament: {date_run} \n</h3>"""
-
-        output += f"<h3>Configuration:\n"
-        output += f"<ul><li>Number of teams: {len(team_stats)}</li>"
-        output += f"<li>Layouts: {len(fixed_layouts) + len(random_layouts)} " \
-                  f"({len(fixed_layouts)} fixed + {len(random_layouts)} random)</li>"
-        output += f"<li>Max steps: {max_steps} steps</li>"
-        output += f"</ul></h3>\n"
-
-        output += """<br/><br/><table border="1">"""
-        if not games:
-            output += "No match was run."
+        yield """<html><head><title>Results for the tournament round</title>\n"""
+        yield """<link rel="stylesheet" type="text/css" href="style.css"/></head>\n"""
+        yield """<body><h1>PACMAN Capture the Flag Tournament</h1>\n"""
+        yield f"""<h2>Tournament Organizer: {organizer} </h2>\n"""
+        yield f"""<h3>Name of Tournament: {run_id} </h3>\n"""
+        yield f"""<h3>Date of Tournament: {date_run} \n</h3>"""
+
+        yield f"<h3>Configuration:\n"
+        yield f"<ul><li>Number of teams: {len(team_stats)}</li>"
+        yield f"<li>Layouts: {len(fixed_layouts) + len(random_layouts)} " \
+              f"({len(fixed_layouts)} fixed + {len(random_layouts)} random)</li>"
+        yield f"<li>Max steps: {max_steps} steps</li>"
+        yield f"</ul></h3>\n"
+
+        yield """<br/><br/><table border="1">"""
+        if not games_summary[0]:
+            yield "No match was run."
         else:
             # First, print a table with the final standing
-            output += self._generate_ranking(team_stats=team_stats)
+            yield from self._generate_ranking(run_id=run_id, team_stats=team_stats, ratings=ratings)
             
-            output += "\n\n<br/><br/>"
-            output += self._generate_disqualified_table(errors_dir=errors_dir)
-
-            output += "\n\n<br/><br/>"
-            output += self._generate_matches_table(games=games, scores_dir=scores_dir, replays_dir=replays_dir,
-                                                   logs_dir=logs_dir)
+            yield "\n\n<br/><br/>"
+            yield from self._generate_disqualified_table(errors_dir=errors_dir)
 
-        output += "\n\n</table></body></html>"
+            yield "\n\n<br/><br/>"
+            yield from self._generate_games_summary(run_id=run_id, games_summary=games_summary)
 
-        return output
+        yield "\n\n</table></body></html>"
 
 
 def main():
     settings = load_settings()
-    html_generator = HtmlGenerator(settings['www_dir'])
+    html_generator = HtmlGenerator(settings['www_dir'], page_size=settings['page_size'])
     html_generator.add_contest_run(run_id=0, contest_name="default", organizer=settings['organizer'])
 
 
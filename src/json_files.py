@@ -0,0 +1,52 @@
+"""
+Reading and writing of the JSON files shared between processes (teams_<contest>.json, contests.json, matches.json,
+tasks.json, ...).
+
+Files are written atomically: the content goes to a temporary file in the same directory, which then replaces the
+file, so a concurrent reader (e.g. an array task loading matches.json) sees either the old or the new file, never a
+half-written one.
+"""
+import json
+import os
+import tempfile
+
+_REQUIRED = object()
+
+
+def dump_json(obj, file_name: str, **json_kwargs) -> None:
+    """json.dump of obj into file_name, atomically"""
+    directory = os.path.dirname(os.path.abspath(file_name))
+    fd, tmp_file = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_name)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(obj, f, **json_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates files only readable by their owner, keep the permissions of the replaced file
+        os.chmod(tmp_file, os.stat(file_name).st_mode & 0o777 if os.path.exists(file_name) else 0o644)
+        os.replace(tmp_file, file_name)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def get_field(json_obj: dict, key: str, expected_type, default=_REQUIRED):
+    """
+    Value of a field of a JSON object, checking its type.
+
+    :param default: value of the field when it is missing, the field is required if no default is given
+    :raises ValueError: if the field is missing (and required) or has the wrong type
+    """
+    if not isinstance(json_obj, dict):
+        raise ValueError(f"JSON object expected, got {type(json_obj).__name__}")
+    if key not in json_obj:
+        if default is _REQUIRED:
+            raise ValueError(f"Missing field '{key}' in {json_obj}")
+        return default
+    value = json_obj[key]
+    expected_types = expected_type if isinstance(expected_type, tuple) else (expected_type,)
+    # bool is a subclass of int, but a boolean is never a valid number here
+    if not isinstance(value, expected_types) or (isinstance(value, bool) and bool not in expected_types):
+        raise ValueError(f"Field '{key}' should be of type {expected_type}, got {value!r}")
+    return value
@@ -0,0 +1,179 @@
+"""
+Per-round archives of the replays and logs of a contest.
+
+Once a round is finished, its replays and logs are packed into www/contest_<name>/replays_archive/replays_<round>.tar
+and www/contest_<name>/logs_archive/logs_<round>.tar, so the filesystem holds a few large files instead of tens of
+thousands of small ones. Each archive comes with an index (<archive>.index.json) giving the offset and size of the
+data of every member, so a single replay can be read with one seek without unpacking (or even parsing) the archive.
+
+The archives are plain (not compressed) tar files: replays and logs are already gzipped one by one, see
+replay_storage.py.
+"""
+import json
+import logging
+import os
+import tarfile
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from replay_storage import COMPRESSED_DIRS, COMPRESSED_SUFFIX
+
+# (directory of the loose files, directory of the archives) in a contest directory
+ARCHIVED_DIRS = (("replays", "replays_archive"), ("logs", "logs_archive"))
+INDEX_SUFFIX = ".index.json"
+
+
+def get_index_file(archive_file: str) -> str:
+    return f"{archive_file}{INDEX_SUFFIX}"
+
+
+def pack_files(archive_file: str, file_paths: List[str]) -> Dict[str, Tuple[int, int]]:
+    """
+    Packs the files in a new tar archive and writes its index, both atomically.
+
+    :return: the index of the archive: offset and size of the data of every member, by member name
+    """
+    with tarfile.open(f"{archive_file}.tmp", "w", format=tarfile.PAX_FORMAT) as tar:
+        for file_path in file_paths:
+            tar.add(file_path, arcname=os.path.basename(file_path), recursive=False)
+    # The headers are read back to get the actual offsets of the data of the members
+    with tarfile.open(f"{archive_file}.tmp", "r") as tar:
+        index = {member.name: (member.offset_data, member.size) for member in tar.getmembers() if member.isfile()}
+    with open(f"{get_index_file(archive_file)}.tmp", "w") as f:
+        json.dump(index, f, sort_keys=True)
+    # The archive is in place before its index, so an index never points to a missing archive
+    os.replace(f"{archive_file}.tmp", archive_file)
+    os.replace(f"{get_index_file(archive_file)}.tmp", get_index_file(archive_file))
+    return index
+
+
+def read_member(archive_file: str, offset: int, size: int) -> bytes:
+    """Reads the data of a member of an archive given its offset and size in the index"""
+    with open(archive_file, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def get_file_match_id(file_name: str) -> Optional[str]:
+    """Id of the match of a replay or log file (match_<id>.replay, match_<id>.log.gz, ...), None for other files"""
+    if not file_name.startswith("match_"):
+        return None
+    base_name = file_name[:-len(COMPRESSED_SUFFIX)] if file_name.endswith(COMPRESSED_SUFFIX) else file_name
+    for _, extension in COMPRESSED_DIRS:
+        if base_name.endswith(extension):
+            return base_name[len("match_"):-len(extension)]
+    return None
+
+
+def get_finished_files(contest_dir: str, files_dir_name: str, unfinished_match_ids: Iterable[str] = ()) -> List[str]:
+    """
+    Paths of the replays or logs of the matches that are finished: they have a score file and are not in
+    unfinished_match_ids (e.g. running according to the match ledger). When a file is being compressed, only its
+    compressed version is taken, the uncompressed one is about to be removed.
+    """
+    files_dir = os.path.join(contest_dir, files_dir_name)
+    scores_dir = os.path.join(contest_dir, "scores")
+    unfinished_match_ids = set(unfinished_match_ids)
+    file_names = set(os.listdir(files_dir))
+    file_paths = []
+    for file_name in sorted(file_names):
+        match_id = get_file_match_id(file_name)
+        if match_id is None or match_id in unfinished_match_ids \
+                or not os.path.isfile(os.path.join(scores_dir, f"match_{match_id}.json")):
+            continue
+        if not file_name.endswith(COMPRESSED_SUFFIX) and (f"{file_name}{COMPRESSED_SUFFIX}" in file_names
+                                                          or f"{file_name}{COMPRESSED_SUFFIX}.tmp" in file_names):
+            continue
+        file_paths.append(os.path.join(files_dir, file_name))
+    return file_paths
+
+
+def pack_round(contest_dir: str, round_id: str, unfinished_match_ids: Iterable[str] = ()) -> Dict[str, int]:
+    """
+    Packs the loose replays and logs of the finished matches of a contest in the archives of a round, and deletes
+    the packed files. The files of the matches still being played are left for a later round.
+
+    :param unfinished_match_ids: ids (as in the score files) of the matches that may still be running
+    :return: number of files packed in each archive directory
+    """
+    num_packed = {}
+    unfinished_match_ids = set(unfinished_match_ids)
+    for files_dir_name, archive_dir_name in ARCHIVED_DIRS:
+        files_dir = os.path.join(contest_dir, files_dir_name)
+        if not os.path.isdir(files_dir):
+            continue
+        file_paths = get_finished_files(contest_dir, files_dir_name, unfinished_match_ids)
+        if not file_paths:
+            continue
+        archive_dir = os.path.join(contest_dir, archive_dir_name)
+        os.makedirs(archive_dir, exist_ok=True)
+        archive_file = os.path.join(archive_dir, f"{files_dir_name}_{round_id}.tar")
+        if os.path.exists(archive_file):
+            raise FileExistsError(f"Archive {archive_file} already exists")
+        pack_files(archive_file, file_paths)
+        # The loose files are only deleted once the archive and its index are safely written
+        for file_path in file_paths:
+            os.remove(file_path)
+        num_packed[archive_dir_name] = len(file_paths)
+        logging.info(f"Packed {len(file_paths)} files of {files_dir} in {archive_file}")
+    return num_packed
+
+
+def list_archives(contest_dir: str) -> List[str]:
+    """Index files of the archives of a contest, relative to the contest directory"""
+    archives = []
+    for _, archive_dir_name in ARCHIVED_DIRS:
+        archive_dir = os.path.join(contest_dir, archive_dir_name)
+        if os.path.isdir(archive_dir):
+            archives.extend(os.path.join(archive_dir_name, file_name) for file_name in sorted(os.listdir(archive_dir))
+                            if file_name.endswith(INDEX_SUFFIX))
+    return archives
+
+
+class ArchiveIndex:
+    """
+    Locates the archived replays and logs of a contest. The indexes of all the archives are merged into one dict
+    keyed by file name, loaded on the first lookup. With auto_refresh, e.g. in a long-running web server, every lookup
+    checks the modification time of the archive directories and the indexes are reloaded when an archive was added;
+    without it, e.g. during one HTML generation, lookups do not touch the file system.
+    """
+    contest_dir: str
+    auto_refresh: bool
+
+    def __init__(self, contest_dir: str, auto_refresh: bool = True):
+        self.contest_dir = contest_dir
+        self.auto_refresh = auto_refresh
+        self._files = None  # files directory name -> file name -> (archive file, offset, size)
+        self._dirs_mtimes = None
+
+    def find(self, files_dir_name: str, file_name: str) -> Optional[Tuple[str, int, int]]:
+        """
+        Looks for a file of the replays or logs directory in the archives.
+
+        :return: the archive file, and the offset and size of the file in it, or None if it is not archived
+        """
+        if self._files is None or self.auto_refresh:
+            self._refresh()
+        return self._files.get(files_dir_name, {}).get(file_name)
+
+    def _refresh(self) -> None:
+        dirs_mtimes = []
+        for _, archive_dir_name in ARCHIVED_DIRS:
+            archive_dir = os.path.join(self.contest_dir, archive_dir_name)
+            dirs_mtimes.append(os.stat(archive_dir).st_mtime if os.path.isdir(archive_dir) else None)
+        if self._files is not None and dirs_mtimes == self._dirs_mtimes:
+            return
+        files = {}
+        for files_dir_name, archive_dir_name in ARCHIVED_DIRS:
+            archive_dir = os.path.join(self.contest_dir, archive_dir_name)
+            if not os.path.isdir(archive_dir):
+                continue
+            dir_files = files.setdefault(files_dir_name, {})
+            # The latest round comes last, so its copy of a file wins
+            for index_file_name in sorted(os.listdir(archive_dir)):
+                if not index_file_name.endswith(INDEX_SUFFIX):
+                    continue
+                archive_file = os.path.join(archive_dir, index_file_name[:-len(INDEX_SUFFIX)])
+                with open(os.path.join(archive_dir, index_file_name), "r") as f:
+                    for member_name, (offset, size) in json.load(f).items():
+                        dir_files[member_name] = (archive_file, offset, size)
+        self._files, self._dirs_mtimes = files, dirs_mtimes
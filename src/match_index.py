@@ -0,0 +1,134 @@
+"""
+In-memory index of the results of all the contests, used to answer the queries of the results web server.
+
+The index is built from the results store of each contest at startup and a contest is reloaded only when the
+modification time of its store changes. The store is opened read-only: the web server workers never write it, only
+the contest manager indexes the score files (once the matches are played, and in its html step).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from ratings import Rating
+from results_store import ResultsStore, get_store_file
+
+
+def match_id_sort_key(match_id: str):
+    return (0, int(match_id), "") if match_id.isdigit() else (1, 0, match_id)
+
+
+@dataclass
+class ContestIndex:
+    """Results of a contest indexed by team"""
+    name: str
+    version: int = 0
+    store_mtime: float = None
+    last_modified: float = 0.0
+    team_games: Dict[str, List[Tuple[str, list]]] = field(default_factory=dict)
+    # points_pct, points, wins, draws, losses, errors, sum_score of each team
+    teams_stats: Dict[str, list] = field(default_factory=dict)
+    ratings: Dict[str, Rating] = field(default_factory=dict)
+
+    def get_etag(self) -> str:
+        """Identifies the content of the index, also across restarts of the server"""
+        return f"{self.name}-{self.store_mtime}-{sum(map(len, self.team_games.values()))}"
+
+    def get_team_names(self) -> List[str]:
+        return sorted(self.team_games)
+
+    def get_team_games(self, team_name: str) -> List[Tuple[str, list]]:
+        return self.team_games.get(team_name, [])
+
+
+class MatchIndex:
+    """Index of all the contests listed in contests.json"""
+    www_dir: str
+    contests_json_file: str
+    refresh_interval: float
+
+    def __init__(self, www_dir: str = "www", contests_json_file: str = "contests.json",
+                 refresh_interval: float = 2.0):
+        """
+        :param www_dir: directory containing the contest_<name> directories
+        :param contests_json_file: JSON file listing the contests
+        :param refresh_interval: minimum seconds between two checks of the scores directory of a contest
+        """
+        self.www_dir = www_dir
+        self.contests_json_file = contests_json_file
+        self.refresh_interval = refresh_interval
+        self.contests = {}
+        self._last_checks = {}
+        self._rebuilding = set()  # contests whose index is being built
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """(Re)Builds the index of every contest"""
+        with open(self.contests_json_file, "r") as f:
+            contest_names = [contest["name"] for contest in json.load(f)["contests"]]
+        with self._lock:
+            self.contests = {contest_name: ContestIndex(name=contest_name) for contest_name in contest_names}
+            self._last_checks = {}
+        for contest_name in contest_names:
+            self.get_contest(contest_name)
+
+    def get_contest_names(self) -> List[str]:
+        return list(self.contests)
+
+    def get_contest(self, contest_name: str) -> ContestIndex:
+        """
+        Returns the up-to-date index of a contest, None if there is no such contest.
+
+        The new index of a contest is built outside the lock, so the other contests are still served meanwhile, and
+        the requests arriving during the build get the previous index of the contest instead of waiting.
+        """
+        with self._lock:
+            contest = self.contests.get(contest_name)
+            if contest is None:
+                return None
+            now = time.time()
+            if contest_name in self._rebuilding:
+                return contest
+            if now - self._last_checks.get(contest_name, 0.0) < self.refresh_interval:
+                return contest
+            self._last_checks[contest_name] = now
+            contest_dir = os.path.join(self.www_dir, f"contest_{contest_name}")
+            store_file = get_store_file(contest_dir)
+            store_mtime = os.stat(store_file).st_mtime if os.path.isfile(store_file) else None
+            if store_mtime == contest.store_mtime and contest.version > 0:
+                return contest
+            self._rebuilding.add(contest_name)
+        try:
+            contest = self._build(contest_name, contest_dir, store_mtime, contest.version + 1)
+        except BaseException:
+            with self._lock:
+                self._rebuilding.discard(contest_name)
+            raise
+        with self._lock:
+            self._rebuilding.discard(contest_name)
+            if contest_name in self.contests:  # not removed by a reload meanwhile
+                self.contests[contest_name] = contest
+        return contest
+
+    @staticmethod
+    def _build(contest_name: str, contest_dir: str, store_mtime: float, version: int) -> ContestIndex:
+        contest = ContestIndex(name=contest_name, version=version, store_mtime=store_mtime,
+                               last_modified=store_mtime or time.time())
+        if store_mtime is None:
+            return contest
+        with ResultsStore(contest_dir=contest_dir, read_only=True) as results_store:
+            for team_name in results_store.get_team_names():
+                contest.team_games[team_name] = []
+            for match_id, game in results_store.get_match_games():
+                for team_name in set(game[:2]):
+                    contest.team_games.setdefault(team_name, []).append((match_id, game))
+            contest.teams_stats = results_store.get_teams_stats()
+            contest.ratings = results_store.get_ratings()
+        # Stable order of the games of a team: by match id (numerically if possible), then by position in the match
+        for team_games in contest.team_games.values():
+            team_games.sort(key=lambda match_game: match_id_sort_key(match_game[0]))
+        logging.info(f"Indexed contest {contest_name} (version {version}): {len(contest.team_games)} teams")
+        return contest
@@ -0,0 +1,109 @@
+"""
+Ledger of the matches of matches.json: whether each match is pending, running, done or failed, how many times it
+was attempted and how long its last attempt took.
+
+Every match has its own entry file match_ledger/<match id>.json, written atomically by the only process playing
+that match, so the many tasks of a Slurm array (possibly on different nodes sharing the file system) update the
+ledger concurrently without locks. If the array is killed or preempted halfway, the ledger tells which matches are
+still to be played: a match left running by a killed task counts as unfinished.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List
+
+from json_files import dump_json, get_field
+
+LEDGER_DIR = "match_ledger"
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUSES = (STATUS_PENDING, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED)
+
+
+@dataclass
+class MatchStatus:
+    """Entry of a match in the ledger"""
+    match_id: str
+    status: str = STATUS_PENDING
+    attempts: int = 0
+    duration: float = 0.0  # seconds taken by the last attempt
+    error: str = ""
+    updated: float = 0.0  # time of the last change
+
+    @classmethod
+    def from_json_obj(cls, json_obj: dict) -> "MatchStatus":
+        status = get_field(json_obj, "status", str)
+        if status not in STATUSES:
+            raise ValueError(f"Unknown match status: {status}")
+        return cls(match_id=get_field(json_obj, "match_id", str), status=status,
+                   attempts=get_field(json_obj, "attempts", int), duration=get_field(json_obj, "duration", (int, float)),
+                   error=get_field(json_obj, "error", str, default=""),
+                   updated=get_field(json_obj, "updated", (int, float), default=0.0))
+
+
+class MatchLedger:
+    """Status of every match of matches.json, one entry file per match"""
+    ledger_dir: str
+
+    def __init__(self, ledger_dir: str = LEDGER_DIR):
+        self.ledger_dir = ledger_dir
+
+    def _get_entry_file(self, match_id: str) -> str:
+        return os.path.join(self.ledger_dir, f"{match_id}.json")
+
+    def reset(self, match_ids: Iterable[str]) -> None:
+        """Starts the ledger of a new matches.json: all its matches are pending"""
+        shutil.rmtree(self.ledger_dir, ignore_errors=True)
+        os.makedirs(self.ledger_dir)
+        for match_id in match_ids:
+            self._save(MatchStatus(match_id=str(match_id), updated=time.time()))
+
+    def get(self, match_id: str) -> MatchStatus:
+        """Entry of a match, pending if it has none (e.g. matches prepared before the ledger existed)"""
+        try:
+            with open(self._get_entry_file(match_id), "r") as f:
+                return MatchStatus.from_json_obj(json.load(f))
+        except FileNotFoundError:
+            return MatchStatus(match_id=match_id)
+        except ValueError as e:
+            logging.warning(f"Invalid ledger entry of match #{match_id}, considered pending: {e}")
+            return MatchStatus(match_id=match_id)
+
+    def get_statuses(self, match_ids: Iterable[str]) -> Dict[str, MatchStatus]:
+        return {match_id: self.get(match_id) for match_id in match_ids}
+
+    def get_unfinished(self, match_ids: Iterable[str]) -> List[str]:
+        """Ids of the matches that are not done, in the given order"""
+        return [match_id for match_id in match_ids if self.get(match_id).status != STATUS_DONE]
+
+    def set_running(self, match_id: str) -> MatchStatus:
+        """Records the start of an attempt to play a match"""
+        entry = self.get(match_id)
+        entry.status, entry.attempts, entry.error, entry.updated = STATUS_RUNNING, entry.attempts + 1, "", time.time()
+        self._save(entry)
+        return entry
+
+    def set_finished(self, match_id: str, success: bool, duration: float, error: str = "") -> MatchStatus:
+        """Records the end of the current attempt to play a match"""
+        entry = self.get(match_id)
+        entry.status = STATUS_DONE if success else STATUS_FAILED
+        entry.duration, entry.error, entry.updated = duration, error, time.time()
+        self._save(entry)
+        return entry
+
+    def _save(self, entry: MatchStatus) -> None:
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        dump_json(asdict(entry), self._get_entry_file(entry.match_id), sort_keys=True, indent=4)
+
+    def get_summary(self, match_ids: Iterable[str]) -> Dict[str, int]:
+        """Number of matches of each status"""
+        summary = {status: 0 for status in STATUSES}
+        for entry in self.get_statuses(match_ids).values():
+            summary[entry.status] += 1
+        return summary
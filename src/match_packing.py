@@ -0,0 +1,96 @@
+"""
+Packs the matches of matches.json into tasks, each task being one element of the Slurm job array.
+"""
+import heapq
+import json
+import logging
+import math
+import os
+from typing import Dict, List, Tuple
+
+from results_store import ResultsStore
+
+# Wall-clock minutes given to a single match in the cluster
+MINUTES_PER_MATCH = 7
+
+
+def pack_by_count(match_ids: List[str], matches_per_task: int) -> List[List[str]]:
+    """Splits the matches into consecutive slices of at most matches_per_task matches"""
+    matches_per_task = max(1, matches_per_task)
+    return [match_ids[i:i + matches_per_task] for i in range(0, len(match_ids), matches_per_task)]
+
+
+def get_match_teams(match_arguments: List[str]) -> Tuple[str, str, str]:
+    """Returns the contest, blue and red team names from the arguments of a match"""
+    return (match_arguments[match_arguments.index("--contest-name") + 1],
+            match_arguments[match_arguments.index("--blue-name") + 1],
+            match_arguments[match_arguments.index("--red-name") + 1])
+
+
+def load_team_durations(contest_dir: str) -> Dict[str, float]:
+    """Average duration in seconds of the matches played by each team, from the results store of a contest"""
+    if not os.path.isdir(os.path.join(contest_dir, "scores")):
+        return {}
+    with ResultsStore(contest_dir=contest_dir) as results_store:
+        # Only the score files that are not in the store yet are parsed
+        results_store.update()
+        return results_store.get_team_durations()
+
+
+class MatchCostEstimator:
+    """Estimates the duration of a match from the historical durations of the matches of both teams"""
+    team_durations: Dict[str, Dict[str, float]]
+    default_duration: float
+
+    def __init__(self, www_dir: str, contest_names: List[str]):
+        self.team_durations = {
+            contest_name: load_team_durations(os.path.join(www_dir, f"contest_{contest_name}"))
+            for contest_name in contest_names}
+        all_durations = [duration for durations in self.team_durations.values() for duration in durations.values()]
+        # Teams without history are assumed to be average, or to use half of the time limit if nothing was played
+        self.default_duration = (sum(all_durations) / len(all_durations) if all_durations
+                                 else MINUTES_PER_MATCH * 60 / 2)
+
+    def get_team_duration(self, contest_name: str, team_name: str) -> float:
+        return self.team_durations.get(contest_name, {}).get(team_name, self.default_duration)
+
+    def estimate(self, match_arguments: List[str]) -> float:
+        contest_name, blue_name, red_name = get_match_teams(match_arguments)
+        return (self.get_team_duration(contest_name, blue_name) + self.get_team_duration(contest_name, red_name)) / 2
+
+
+def pack_by_runtime(match_costs: Dict[str, float], num_tasks: int,
+                    cpus_per_task: int = 1) -> Tuple[List[List[str]], float]:
+    """
+    Longest-processing-time-first packing: every match, from the most to the least expensive, goes to the least
+    loaded of the num_tasks * cpus_per_task workers, and task i gets the matches of its cpus_per_task workers.
+
+    :return: the tasks and the predicted makespan in seconds
+    """
+    num_tasks = max(1, min(num_tasks, len(match_costs)))
+    cpus_per_task = max(1, cpus_per_task)
+    workers = [(0.0, worker_id) for worker_id in range(num_tasks * cpus_per_task)]
+    tasks = [[] for _ in range(num_tasks)]
+    for match_id, cost in sorted(match_costs.items(), key=lambda item: item[1], reverse=True):
+        load, worker_id = heapq.heappop(workers)
+        tasks[worker_id // cpus_per_task].append(match_id)
+        heapq.heappush(workers, (load + cost, worker_id))
+    makespan = max(load for load, _ in workers)
+    logging.info(f"Packed {len(match_costs)} matches into {num_tasks} tasks, predicted makespan: {makespan:.0f}s")
+    return [task for task in tasks if task], makespan
+
+
+def get_task_minutes(task_size: int, cpus_per_task: int) -> int:
+    """Time limit of a task playing task_size matches, cpus_per_task at a time"""
+    return MINUTES_PER_MATCH * math.ceil(task_size / max(1, cpus_per_task))
+
+
+def tasks_to_json_obj(tasks: List[List[str]]) -> Dict[str, List[str]]:
+    """Array task ids start at 1, as the indices of the Slurm array"""
+    return {str(task_id): match_ids for task_id, match_ids in enumerate(tasks, start=1)}
+
+
+def load_task_matches(task_id: str, tasks_file: str = "tasks.json") -> List[str]:
+    """Returns the match ids of an array task"""
+    with open(tasks_file, "r") as f:
+        return json.load(f)[task_id]
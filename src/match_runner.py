@@ -0,0 +1,176 @@
+"""
+Runs the matches of matches.json on the local machine.
+
+Every match is played by its own worker process (this very script), so a crashing or hanging match cannot take
+the others down, and several workers run concurrently to use all the cores of the machine. The game engine records
+the scores, replays and logs in the usual www/contest_<name>/{scores,replays,logs} layout, and every attempt is
+recorded in the match ledger (see match_ledger.py) if one is given.
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from match_ledger import MatchLedger
+from replay_storage import compress_match_files
+
+
+@dataclass
+class MatchRunResult:
+    """Outcome of playing a match, possibly after several attempts"""
+    match_id: str
+    success: bool
+    attempts: int = 0
+    duration: float = 0.0
+    error: str = ""
+
+
+def load_matches(matches_file: str = "matches.json") -> Dict[str, list]:
+    with open(matches_file, "r") as f:
+        return json.load(f)
+
+
+def run_match(match_id: str, matches_file: str = "matches.json", www_dir: str = "www",
+              ledger: MatchLedger = None) -> None:
+    """Plays a single match in the current process, its replay and log are then stored compressed"""
+    from contest import capture
+    matches = load_matches(matches_file)
+    match_arguments = matches[match_id]
+    print(f"Match #{match_id}: args={match_arguments}")
+    if ledger is not None:
+        ledger.set_running(match_id)
+    start = time.time()
+    try:
+        capture.run(match_arguments)
+        contest_name = match_arguments[match_arguments.index("--contest-name") + 1]
+        compress_match_files(os.path.join(www_dir, f"contest_{contest_name}"),
+                             match_arguments[match_arguments.index("-m") + 1])
+    except BaseException as e:
+        if ledger is not None:
+            ledger.set_finished(match_id, success=False, duration=time.time() - start, error=repr(e))
+        raise
+    if ledger is not None:
+        ledger.set_finished(match_id, success=True, duration=time.time() - start)
+
+
+class LocalMatchRunner:
+    """Plays many matches concurrently, one worker process per match"""
+    jobs: int
+    timeout: int
+    retries: int
+    matches_file: str
+    ledger: MatchLedger
+
+    def __init__(self, jobs: int = 1, timeout: int = None, retries: int = 1, matches_file: str = "matches.json",
+                 ledger: MatchLedger = None):
+        """
+        :param jobs: number of matches played at the same time
+        :param timeout: wall-clock seconds after which a match is killed (None for no limit)
+        :param retries: number of times a crashed or killed match is played again
+        :param matches_file: JSON file with the arguments of every match
+        :param ledger: ledger recording every attempt, None to record nothing
+        """
+        self.jobs = max(1, jobs)
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.matches_file = matches_file
+        self.ledger = ledger
+        self._lock = threading.Lock()
+        self._num_done = 0
+
+    def run(self, match_ids: List[str]) -> Dict[str, MatchRunResult]:
+        """Plays all the given matches and returns their outcome by match id"""
+        self._num_done = 0
+        start = time.time()
+        logging.info(f"Running {len(match_ids)} matches with {self.jobs} workers")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            results = list(pool.map(lambda match_id: self._run_with_retries(match_id, len(match_ids)), match_ids))
+        failed = [result.match_id for result in results if not result.success]
+        logging.info(f"Played {len(match_ids) - len(failed)}/{len(match_ids)} matches in "
+                     f"{time.time() - start:.1f}s, failed: {failed}")
+        return {result.match_id: result for result in results}
+
+    def run_pulled(self, next_match_id: Callable[[], Optional[str]],
+                   on_finished: Callable[[MatchRunResult], None] = None) -> Dict[str, MatchRunResult]:
+        """
+        Plays matches as long as next_match_id returns one: each of the jobs workers pulls a new match as soon as it
+        is free, so the matches do not need to be known in advance (e.g. they are taken from a shared work queue).
+
+        :param on_finished: called with the outcome of every match, from the thread of its worker
+        :return: the outcome of the played matches by match id
+        """
+        self._num_done = 0
+        start = time.time()
+        results = {}
+
+        def work():
+            match_id = next_match_id()
+            while match_id is not None:
+                result = self._run_with_retries(match_id, num_matches=None)
+                results[match_id] = result
+                if on_finished is not None:
+                    on_finished(result)
+                match_id = next_match_id()
+
+        logging.info(f"Running the pulled matches with {self.jobs} workers")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            for future in [pool.submit(work) for _ in range(self.jobs)]:
+                future.result()
+        failed = [result.match_id for result in results.values() if not result.success]
+        logging.info(f"Played {len(results) - len(failed)}/{len(results)} matches in "
+                     f"{time.time() - start:.1f}s, failed: {failed}")
+        return results
+
+    def _run_with_retries(self, match_id: str, num_matches: Optional[int]) -> MatchRunResult:
+        result = MatchRunResult(match_id=match_id, success=False)
+        start = time.time()
+        while not result.success and result.attempts <= self.retries:
+            result.attempts += 1
+            if self.ledger is not None:
+                self.ledger.set_running(match_id)
+            attempt_start = time.time()
+            result.success, result.error = self._run_worker(match_id)
+            if self.ledger is not None:
+                self.ledger.set_finished(match_id, result.success, duration=time.time() - attempt_start,
+                                         error=result.error)
+            if not result.success:
+                logging.warning(f"Match #{match_id} failed (attempt {result.attempts}): {result.error}")
+        result.duration = time.time() - start
+        with self._lock:
+            self._num_done += 1
+            logging.info(f"[{self._num_done}/{num_matches or '?'}] Match #{match_id} "
+                         f"{'done' if result.success else 'FAILED'} in {result.duration:.1f}s")
+        return result
+
+    def _run_worker(self, match_id: str) -> Tuple[bool, str]:
+        try:
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), "--matches-file", self.matches_file,
+                                      match_id],
+                                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                     text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            return False, f"killed after {self.timeout} seconds"
+        if process.returncode != 0:
+            error = process.stderr.strip().splitlines()
+            return False, f"exit code {process.returncode}: {error[-1] if error else ''}"
+        return True, ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays a single match of the matches file.')
+    parser.add_argument("match_id", type=str, help='id of the match in the matches file')
+    parser.add_argument("--matches-file", dest='matches_file', type=str, default="matches.json",
+                        help='JSON file with the arguments of every match')
+    args = parser.parse_args()
+    run_match(args.match_id, matches_file=args.matches_file)
+
+
+if __name__ == "__main__":
+    main()
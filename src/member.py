@@ -1,15 +1,18 @@
 from dataclasses import dataclass
 
+from json_files import get_field
+
 
 @dataclass
 class Member:
-    name: str = "default"
-    identifier: str = "default"
+    # Slotted: no per-instance __dict__, there is one object per member of every team
+    __slots__ = ("name", "identifier")
+    name: str
+    identifier: str
 
     def __init__(self, json_member: dict):
-        assert all(k in json_member for k in ("name", "id"))
-        self.name = json_member["name"]
-        self.identifier = json_member["id"]
+        self.name = get_field(json_member, "name", str)
+        self.identifier = get_field(json_member, "id", (str, int))
 
     def get_name(self):
         return self.name
@@ -18,4 +21,4 @@ class Member:
         return self.identifier
 
     def to_json_obj(self):
-        return {"name": self.name, "id": self.identifier}
+        return {"id": self.identifier, "name": self.name}
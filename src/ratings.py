@@ -0,0 +1,85 @@
+"""
+Ratings of the teams, from the results of their games.
+
+Every team has a rating and a deviation (the uncertainty of the rating), updated after every game with the Glicko
+system: a game against a team whose rating is well known moves the rating more, and the deviation shrinks as the team
+plays. From two ratings we get the probability that a team wins, and the probability that the two teams are ranked
+in the wrong order, used to decide which matches are worth playing.
+"""
+import math
+from dataclasses import dataclass
+from typing import Dict
+
+INITIAL_RATING = 1500.0
+INITIAL_DEVIATION = 350.0
+# The deviation never goes below this, so the ratings keep following teams that improve
+MIN_DEVIATION = 30.0
+_Q = math.log(10) / 400
+
+
+@dataclass
+class Rating:
+    rating: float = INITIAL_RATING
+    deviation: float = INITIAL_DEVIATION
+    games: int = 0
+
+
+def _g(deviation: float) -> float:
+    return 1 / math.sqrt(1 + 3 * (_Q * deviation) ** 2 / math.pi ** 2)
+
+
+def expected_score(rating: Rating, opponent: Rating) -> float:
+    """Expected score (probability of winning, ties counting half) of a team against an opponent"""
+    return 1 / (1 + 10 ** (-_g(opponent.deviation) * (rating.rating - opponent.rating) / 400))
+
+
+def misranking_probability(rating: Rating, other: Rating) -> float:
+    """Probability that the true ratings of two teams are in the opposite order of their current ratings"""
+    deviation = math.hypot(rating.deviation, other.deviation)
+    return 0.5 * math.erfc(abs(rating.rating - other.rating) / (deviation * math.sqrt(2)))
+
+
+def get_game_score(game: list) -> float:
+    """Score of the first team of a game (n1, n2, layout, score, winner, time_taken, match_id): 1, 0.5 or 0"""
+    if game[4] == game[0]:
+        return 1.0
+    if game[4] == game[1]:
+        return 0.0
+    return 0.5  # tie
+
+
+class RatingEngine:
+    """Ratings of all the teams of a contest, updated game by game in O(1)"""
+    ratings: Dict[str, Rating]
+
+    def __init__(self, ratings: Dict[str, Rating] = None):
+        self.ratings = {} if ratings is None else ratings
+
+    def get_rating(self, team_name: str) -> Rating:
+        """Rating of a team, the initial rating if it did not play yet"""
+        return self.ratings.get(team_name) or Rating()
+
+    def update(self, team_name: str, opponent_name: str, score: float) -> None:
+        """Updates the ratings of two teams after a game, score being the score of the first team: 1, 0.5 or 0"""
+        rating, opponent = self.get_rating(team_name), self.get_rating(opponent_name)
+        self.ratings[team_name] = self._updated(rating, opponent, score)
+        self.ratings[opponent_name] = self._updated(opponent, rating, 1 - score)
+
+    @staticmethod
+    def _updated(rating: Rating, opponent: Rating, score: float) -> Rating:
+        g = _g(opponent.deviation)
+        expected = expected_score(rating, opponent)
+        inverse_variance = 1 / rating.deviation ** 2 + _Q ** 2 * g ** 2 * expected * (1 - expected)
+        return Rating(rating=rating.rating + _Q / inverse_variance * g * (score - expected),
+                      deviation=max(MIN_DEVIATION, math.sqrt(1 / inverse_variance)),
+                      games=rating.games + 1)
+
+    @staticmethod
+    def get_expected_rating(rating: Rating, opponent: Rating) -> Rating:
+        """Rating after a game that ends as expected: same rating, but a smaller deviation"""
+        return RatingEngine._updated(rating, opponent, expected_score(rating, opponent))
+
+    def add_game(self, game: list) -> None:
+        if game[0] != game[1]:
+            self.update(game[0], game[1], get_game_score(game))
+
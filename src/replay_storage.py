@@ -0,0 +1,113 @@
+"""
+Compressed storage of the replays and logs of the matches.
+
+The replay (www/contest_<name>/replays/match_<id>.replay) and the log (www/contest_<name>/logs/match_<id>.log) of a
+match are gzipped as soon as the match finishes, and stored as match_<id>.replay.gz and match_<id>.log.gz. The web
+server sends them compressed with Content-Encoding: gzip, so browsers decompress them on the fly.
+
+Run this script to compress the replays and logs recorded before (or the ones left by matches played elsewhere):
+
+    python replay_storage.py --www-dir www
+"""
+import argparse
+import gzip
+import logging
+import os
+import shutil
+from typing import List, Tuple
+
+COMPRESSED_SUFFIX = ".gz"
+COMPRESSION_LEVEL = 6
+# Sub-directories of a contest whose files are stored compressed, and the extension of their files
+COMPRESSED_DIRS = (("replays", ".replay"), ("logs", ".log"))
+
+
+def compress_file(file_path: str) -> str:
+    """
+    Replaces a file by its gzipped version, written to a temporary file first so it is never seen half-written.
+
+    :return: the path of the compressed file
+    """
+    compressed_path = f"{file_path}{COMPRESSED_SUFFIX}"
+    with open(file_path, "rb") as f_in, open(f"{compressed_path}.tmp", "wb") as f_out:
+        # No file name nor time in the header, so the same content always gives the same file
+        with gzip.GzipFile(filename="", mode="wb", fileobj=f_out, compresslevel=COMPRESSION_LEVEL, mtime=0) as gz:
+            shutil.copyfileobj(f_in, gz)
+    shutil.copystat(file_path, f"{compressed_path}.tmp")
+    os.replace(f"{compressed_path}.tmp", compressed_path)
+    os.remove(file_path)
+    return compressed_path
+
+
+def get_match_files(contest_dir: str, match_id: str) -> List[str]:
+    """Paths of the (uncompressed) replay and log of a match"""
+    return [os.path.join(contest_dir, dir_name, f"match_{match_id}{extension}")
+            for dir_name, extension in COMPRESSED_DIRS]
+
+
+def compress_match_files(contest_dir: str, match_id: str) -> List[str]:
+    """Compresses the replay and the log of a match that has just finished, returns the compressed files"""
+    return [compress_file(file_path) for file_path in get_match_files(contest_dir, match_id)
+            if os.path.isfile(file_path)]
+
+
+def find_stored_file(file_path: str) -> Tuple[str, bool]:
+    """
+    Returns the path where a file is actually stored and whether it is compressed, (None, False) if it does not exist.
+    """
+    if os.path.isfile(file_path):
+        return file_path, False
+    if os.path.isfile(f"{file_path}{COMPRESSED_SUFFIX}"):
+        return f"{file_path}{COMPRESSED_SUFFIX}", True
+    return None, False
+
+
+def remove_stored_file(file_path: str) -> None:
+    """Removes a file, both the uncompressed and the compressed version"""
+    for path in (file_path, f"{file_path}{COMPRESSED_SUFFIX}"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def migrate(www_dir: str) -> Tuple[int, int]:
+    """
+    Compresses all the replays and logs of all the contests of a www directory.
+
+    :return: the number of files compressed and the bytes saved
+    """
+    num_files, saved_bytes = 0, 0
+    for contest_dir_name in sorted(os.listdir(www_dir)):
+        if not contest_dir_name.startswith("contest_"):
+            continue
+        for dir_name, extension in COMPRESSED_DIRS:
+            files_dir = os.path.join(www_dir, contest_dir_name, dir_name)
+            if not os.path.isdir(files_dir):
+                continue
+            for file_name in sorted(os.listdir(files_dir)):
+                if not file_name.endswith(extension):
+                    continue
+                file_path = os.path.join(files_dir, file_name)
+                size = os.path.getsize(file_path)
+                saved_bytes += size - os.path.getsize(compress_file(file_path))
+                num_files += 1
+        logging.info(f"{contest_dir_name}: {num_files} files compressed so far, {saved_bytes / 2**20:.1f} MiB saved")
+    if num_files:
+        # The pages link the files as they are stored, they must be regenerated even if the results did not change.
+        # Imported here as the HTML generator itself depends on this module
+        from html_generator import invalidate_runs
+        invalidate_runs(www_dir)
+    return num_files, saved_bytes
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Compresses the replays and logs of all the contests.')
+    parser.add_argument("--www-dir", dest='www_dir', type=str, default="www",
+                        help='directory containing the contest_<name> directories')
+    args = parser.parse_args()
+    num_files, saved_bytes = migrate(args.www_dir)
+    print(f"Compressed {num_files} files, saved {saved_bytes / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import concurrent.futures
+import logging
+import os
+import shutil
+import subprocess
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from git import Repo
+from team import Team
+
+SYNC_NEW = "new"
+SYNC_UPDATED = "updated"
+SYNC_UNCHANGED = "unchanged"
+SYNC_FAILED = "failed"
+
+
+@dataclass
+class RepoSyncResult:
+    """Outcome of synchronizing the local copy of a team repository"""
+    contest_name: str
+    team_name: str
+    repo_dir: str
+    status: str
+    commit: str = ""
+    error: str = ""
+    duration: float = 0.0
+
+    def is_updated(self) -> bool:
+        return self.status in (SYNC_NEW, SYNC_UPDATED)
+
+
+def clone_repo(url: str, dest_folder: str, timeout: int = None) -> Repo:
+    """
+    Method to easily clone a public repository.
+
+    git is run directly because Repo.clone_from does not apply kill_after_timeout to clones. git never prompts
+    for credentials (e.g. for a private or mistyped URL), and a partial clone is removed on failure so that it is
+    not taken for an existing repository by the next sync.
+    """
+    try:
+        subprocess.run(["git", "clone", url, dest_folder], env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+                       stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                       timeout=timeout, check=True)
+    except subprocess.TimeoutExpired:
+        shutil.rmtree(dest_folder, ignore_errors=True)
+        raise RuntimeError(f"git clone of {url} killed after {timeout} seconds")
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(dest_folder, ignore_errors=True)
+        raise RuntimeError(f"git clone of {url} failed: {e.stderr.strip()}")
+    return Repo(dest_folder)
+
+
+def get_cloned_repo(dest_folder: str) -> Repo:
+    """Method to get an already cloned repository"""
+    return Repo(dest_folder)
+
+
+def update_repo(repo: Repo, timeout: int = None) -> None:
+    """
+    Moves the local copy of a repository to the HEAD of its remote. The copy is a mirror, so the history of the
+    remote wins even if it was rewritten (amended or force-pushed commits), where a pull would fail on divergent
+    branches. As for the clones, git never prompts for credentials.
+    """
+    remote = repo.remote()
+    with repo.git.custom_environment(GIT_TERMINAL_PROMPT="0"):
+        remote.fetch(kill_after_timeout=timeout)
+        repo.git.reset("--hard", f"{remote.name}/HEAD", kill_after_timeout=timeout)
+
+
+def get_repo_commit(repo: Repo) -> str:
+    return str(repo.head.reference.commit)
+
+
+class RepoSyncer:
+    """Clones or updates the repositories of many teams concurrently.
+
+    Git operations are I/O bound, so a thread pool is enough to overlap them; every git process is killed
+    after `timeout` seconds so a single unreachable remote cannot stall the whole contest.
+    """
+    max_workers: int
+    timeout: int
+
+    def __init__(self, max_workers: int = 8, timeout: int = 300):
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+    def sync(self, jobs: List[Tuple[str, Team, str]]) -> List[RepoSyncResult]:
+        """
+        Synchronizes all the given repositories.
+
+        :param jobs: list of (contest_name, team, repo_local_dir)
+        :return: one result per job, in the same order
+        """
+        results = [None] * len(jobs)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._sync_one, contest_name, team.get_name(), team.get_repository(),
+                                   team.get_last_commit(), repo_dir): idx
+                       for idx, (contest_name, team, repo_dir) in enumerate(jobs)}
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                logging.info(f"Repository {result.repo_dir}: {result.status} ({result.duration:.1f}s) "
+                             f"commit={result.commit} {result.error}")
+                results[futures[future]] = result
+        return results
+
+    def _sync_one(self, contest_name: str, team_name: str, url: str, last_commit: str,
+                  repo_dir: str) -> RepoSyncResult:
+        start = time.time()
+        result = RepoSyncResult(contest_name=contest_name, team_name=team_name, repo_dir=repo_dir,
+                                status=SYNC_FAILED)
+        try:
+            if not os.path.isdir(repo_dir):
+                repo = clone_repo(url=url, dest_folder=repo_dir, timeout=self.timeout)
+                result.status = SYNC_NEW
+            else:
+                repo = get_cloned_repo(dest_folder=repo_dir)
+                if repo.remotes:
+                    update_repo(repo=repo, timeout=self.timeout)
+            result.commit = get_repo_commit(repo=repo)
+            if result.status != SYNC_NEW:
+                result.status = SYNC_UPDATED if result.commit != last_commit else SYNC_UNCHANGED
+        except Exception as e:
+            result.status = SYNC_FAILED
+            result.error = str(e).strip()
+        result.duration = time.time() - start
+        return result
+
+
+def summarize(results: List[RepoSyncResult]) -> Dict[str, List[str]]:
+    """Groups the qualified team names (<contest>/<team>) by sync status and logs the summary"""
+    summary = {SYNC_NEW: [], SYNC_UPDATED: [], SYNC_UNCHANGED: [], SYNC_FAILED: []}
+    for result in results:
+        summary[result.status].append(f"{result.contest_name}/{result.team_name}")
+    logging.info(f"Repository sync summary: {len(summary[SYNC_NEW])} new, {len(summary[SYNC_UPDATED])} updated, "
+                 f"{len(summary[SYNC_UNCHANGED])} unchanged, {len(summary[SYNC_FAILED])} failed")
+    for team_name in summary[SYNC_FAILED]:
+        logging.warning(f"Repository sync failed for {team_name}")
+    return summary
@@ -0,0 +1,262 @@
+"""
+Logic of the results web API shared by the Flask application (flask_app.py) and the asynchronous server
+(results_server.py): queries on the match index, conditional requests, and how every downloaded file is sent (where
+it is read from, whether it is decompressed, its cache validators and headers).
+
+Nothing here depends on the web framework: the request arguments and headers are passed as mappings, and the
+servers only turn the results into responses of their framework.
+"""
+import datetime
+import email.utils
+import gzip
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from match_archive import ArchiveIndex, read_member
+from match_index import ContestIndex, MatchIndex
+from replay_storage import COMPRESSED_SUFFIX, find_stored_file
+
+# Maximum number of matches returned by a single /get_matches request
+MAX_MATCHES_LIMIT = 1000
+# Files that can be downloaded, they are in the <type>s directory of the contest
+DOWNLOAD_FILE_TYPES = ('score', 'replay', 'log')
+# Published scores, replays and logs do not change: clients reuse them for an hour, then revalidate them
+DOWNLOAD_MAX_AGE = 3600
+
+
+def get_contest_name(args: Mapping, year: str) -> str:
+    """Contests are selected by name, or by year for the upf-ai<year> contests"""
+    return args.get('contest') or f"upf-ai{year}"
+
+
+def get_int_arg(args: Mapping, name: str, default: int, minimum: int = 0, maximum: int = None) -> int:
+    try:
+        value = int(args[name])
+    except (KeyError, TypeError, ValueError):
+        return default
+    value = max(minimum, value)
+    return min(value, maximum) if maximum is not None else value
+
+
+def to_http_date(timestamp: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(int(timestamp), tz=datetime.timezone.utc)
+
+
+def get_query_validators(contest: ContestIndex,
+                         query_items: Iterable[Tuple[str, str]]) -> Tuple[str, datetime.datetime]:
+    """ETag (of the contest index and the query) and Last-Modified of a response built from the index"""
+    query = "&".join(f"{key}={value}" for key, value in sorted(query_items))
+    etag = hashlib.sha1(f"{contest.get_etag()}?{query}".encode()).hexdigest()
+    return etag, to_http_date(contest.last_modified)
+
+
+def is_not_modified(request_headers: Mapping, etag: str, last_modified: datetime.datetime) -> bool:
+    """Whether the copy of the client is still valid, given the conditional headers of its request"""
+    if_none_match = request_headers.get('If-None-Match')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or any(tag.removeprefix("W/") == f'"{etag}"' for tag in tags)
+    if_modified_since = request_headers.get('If-Modified-Since')
+    if not if_modified_since:
+        return False
+    try:
+        since = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    return since >= last_modified
+
+
+def get_validator_headers(etag: str, last_modified: datetime.datetime, cache_control: str) -> Dict[str, str]:
+    return {'ETag': f'"{etag}"', 'Last-Modified': email.utils.format_datetime(last_modified, usegmt=True),
+            'Cache-Control': cache_control}
+
+
+@dataclass
+class QueryResult:
+    """Response of a query on the index of a contest: its JSON body, None if the copy of the client is still valid"""
+    body: Optional[dict]
+    headers: Dict[str, str]
+
+
+def answer_query(contest: ContestIndex, query_items: Iterable[Tuple[str, str]], request_headers: Mapping,
+                 get_body: Callable[[], dict]) -> QueryResult:
+    """
+    Answers a query on the index of a contest. Browsers and proxies revalidate with the index version, the body is
+    not recomputed if it did not change.
+    """
+    etag, last_modified = get_query_validators(contest, query_items)
+    body = None if is_not_modified(request_headers, etag, last_modified) else get_body()
+    return QueryResult(body=body, headers=get_validator_headers(etag, last_modified, 'no-cache'))
+
+
+def get_all_team_names(match_index: MatchIndex) -> List[str]:
+    team_names = set()
+    for contest_name in match_index.get_contest_names():
+        team_names.update(match_index.get_contest(contest_name).get_team_names())
+    return list(team_names)
+
+
+def get_matches(contest: ContestIndex, year: str, args: Mapping) -> dict:
+    """Body of a /get_matches response: the games of a team, optionally filtered by layout and opponent, paginated"""
+    selected_layout = args.get('layout')
+    selected_opponent = args.get('opponent')
+    offset = get_int_arg(args, 'offset', default=0)
+    limit = get_int_arg(args, 'limit', default=MAX_MATCHES_LIMIT, maximum=MAX_MATCHES_LIMIT)
+    games = [(match_id, game) for match_id, game in contest.get_team_games(args.get('team_name'))
+             if (selected_layout is None or game[2] == selected_layout)
+             and (selected_opponent is None or selected_opponent in game[:2])]
+    matches = []
+    for match_id, game in games[offset:offset + limit]:
+        # Add the correct suffix based on the file type
+        score_file = f"match_{match_id}.json"
+        replay_file = f"match_{match_id}.replay"
+        log_file = f"match_{match_id}.log"
+        match = {
+            'team1': game[0],
+            'team2': game[1],
+            'layout': game[2],
+            'time': game[3],
+            'score': game[5],
+            'winner': game[0] if game[5] > 0 else game[1],
+            'score_file': f"/download/{year}/score/{score_file}",
+            'replay_file': f"/download/{year}/replay/{replay_file}",
+            'log_file': f"/download/{year}/log/{log_file}"
+        }
+        matches.append(match)
+    return {'matches': matches, 'total': len(games), 'offset': offset, 'limit': limit}
+
+
+def get_ranking(contest: ContestIndex) -> dict:
+    """Body of a /get_ranking response: the stats and the rating of every team, in the order of the standings"""
+    ranking = []
+    for team_name, (points_pct, points, wins, draws, losses, errors, sum_score) in sorted(
+            contest.teams_stats.items(), key=lambda item: (item[1][0], item[1][2], item[1][6]), reverse=True):
+        rating = contest.ratings.get(team_name)
+        ranking.append({
+            'team_name': team_name,
+            'points_pct': points_pct,
+            'points': points,
+            'wins': wins,
+            'draws': draws,
+            'losses': losses,
+            'errors': errors,
+            'sum_score': sum_score,
+            'rating': rating.rating if rating else None,
+            'deviation': rating.deviation if rating else None,
+            'rated_games': rating.games if rating else 0,
+        })
+    return {'ranking': ranking}
+
+
+def get_download_path(match_index: MatchIndex, contest_name: str, file_type: str,
+                      file_name: str) -> Optional[Tuple[str, str]]:
+    """
+    Contest directory and path of a downloadable file, None if it is not in the directories of a known contest.
+    """
+    if file_type not in DOWNLOAD_FILE_TYPES or contest_name not in match_index.get_contest_names():
+        return None
+    if not file_name or file_name in (".", "..") or "/" in file_name or "\\" in file_name or "\0" in file_name:
+        return None
+    contest_dir = os.path.abspath(os.path.join(match_index.www_dir, f"contest_{contest_name}"))
+    return contest_dir, os.path.join(contest_dir, f"{file_type}s", file_name)
+
+
+def find_archived_file(archive_index: ArchiveIndex, files_dir_name: str,
+                       file_name: str) -> Optional[Tuple[str, int, int, bool]]:
+    """Archive, offset and size of an archived replay or log, and whether it is compressed, None if not archived"""
+    for member_name, compressed in ((file_name, False), (f"{file_name}{COMPRESSED_SUFFIX}", True)):
+        archived = archive_index.find(files_dir_name, member_name)
+        if archived is not None:
+            return (*archived, compressed)
+    return None
+
+
+def get_archived_validators(archive_file: str, offset: int, size: int,
+                            decompress: bool) -> Tuple[str, datetime.datetime]:
+    """ETag and Last-Modified of a member of an archive, sent compressed or decompressed"""
+    stat = os.stat(archive_file)
+    etag = hashlib.sha1(f"{archive_file}-{stat.st_mtime}-{offset}-{size}-{decompress}".encode()).hexdigest()
+    return etag, to_http_date(stat.st_mtime)
+
+
+@dataclass
+class Download:
+    """
+    How a downloaded file is sent. A file sent as it is stored has no etag: the web framework sends it from its path,
+    with its own validators. Otherwise (archived files, and gzipped files for the clients not accepting gzip) the
+    content is read with read() and sent with the etag and last_modified validators.
+    """
+    file_name: str
+    mimetype: str
+    compressed: bool  # stored gzipped
+    decompress: bool  # stored gzipped but sent decompressed
+    path: str = None  # file in the replays/logs/scores directory, None if archived
+    archive_file: str = None
+    offset: int = 0
+    size: int = 0
+    etag: str = None
+    last_modified: datetime.datetime = None
+
+    def read(self) -> bytes:
+        if self.path is None:
+            data = read_member(self.archive_file, self.offset, self.size)
+            return gzip.decompress(data) if self.decompress else data
+        with (gzip.open if self.decompress else open)(self.path, "rb") as f:
+            return f.read()
+
+    def is_not_modified(self, request_headers: Mapping) -> bool:
+        return self.etag is not None and is_not_modified(request_headers, self.etag, self.last_modified)
+
+    def get_headers(self) -> Dict[str, str]:
+        """
+        Headers of the content: its validators, if it is not sent from its path, and Content-Encoding for the gzipped
+        files, for browsers to decompress them
+        """
+        headers = {}
+        if self.etag is not None:
+            headers.update(get_validator_headers(self.etag, self.last_modified, f"public, max-age={DOWNLOAD_MAX_AGE}"))
+        if self.compressed:
+            if not self.decompress:
+                headers['Content-Encoding'] = 'gzip'
+            headers['Vary'] = 'Accept-Encoding'
+        return headers
+
+
+def get_download(match_index: MatchIndex, archive_indexes: Dict[str, ArchiveIndex], contest_name: str,
+                 file_type: str, file_name: str, accepts_gzip: bool) -> Optional[Download]:
+    """
+    How to send a downloadable file, None if there is no such file. Replays and logs are looked for in the
+    archives of the rounds (indexes cached in archive_indexes, by contest directory) when they are not stored loose.
+    This reads the file system, asynchronous servers should call it in a thread.
+    """
+    download_path = get_download_path(match_index, contest_name, file_type, file_name)
+    if download_path is None:
+        return None
+    contest_dir, file_path = download_path
+    mimetype = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+    stored_path, compressed = find_stored_file(file_path)
+    if stored_path is not None:
+        download = Download(file_name=file_name, mimetype=mimetype, compressed=compressed,
+                            decompress=compressed and not accepts_gzip, path=stored_path)
+        if download.decompress:
+            stat = os.stat(stored_path)
+            download.etag = f"{stat.st_mtime}-{stat.st_size}-identity"
+            download.last_modified = to_http_date(stat.st_mtime)
+        return download
+    # Packed with the other replays and logs of its round
+    if contest_dir not in archive_indexes:
+        archive_indexes[contest_dir] = ArchiveIndex(contest_dir)
+    archived = find_archived_file(archive_indexes[contest_dir], f"{file_type}s", file_name)
+    if archived is None:
+        return None
+    archive_file, offset, size, compressed = archived
+    download = Download(file_name=file_name, mimetype=mimetype, compressed=compressed,
+                        decompress=compressed and not accepts_gzip, archive_file=archive_file, offset=offset,
+                        size=size)
+    download.etag, download.last_modified = get_archived_validators(archive_file, offset, size, download.decompress)
+    return download
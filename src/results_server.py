@@ -0,0 +1,116 @@
+"""
+Asynchronous (ASGI) version of the results web server of flask_app.py, for many concurrent viewers.
+
+It serves the same routes (/tournament, /get_matches, /get_teams and /download/...) with Quart, and the blocking work
+(refreshing the match index, reading archived replays) runs in threads so the event loop keeps serving the other
+clients. Several worker processes can be started, each one with its own match index:
+
+    python results_server.py --workers 4 --port 5000
+
+Needs the quart and uvicorn packages (pip install quart uvicorn).
+"""
+import argparse
+import asyncio
+import os
+
+from quart import Quart, abort, jsonify, render_template, request, send_file
+
+from match_index import MatchIndex
+import results_api
+
+app = Quart(__name__, static_folder='./www/static', template_folder='./www')
+
+# Results of all the contests of contests.json, loaded by each worker when it starts
+match_index = MatchIndex(www_dir='./www', contests_json_file='contests.json')
+# Indexes of the archived replays and logs, by contest directory
+archive_indexes = {}
+
+
+@app.before_serving
+async def load_match_index():
+    await asyncio.to_thread(match_index.load)
+
+
+async def get_contest(year):
+    # The index of a contest is rebuilt when its results store changes
+    contest = await asyncio.to_thread(match_index.get_contest, results_api.get_contest_name(request.args, year))
+    if contest is None:
+        abort(404)
+    return contest
+
+
+async def send_download(download):
+    """Same as in flask_app.py, the files that are not sent as they are stored are read in a thread"""
+    if download.etag is None:
+        response = await send_file(download.path, mimetype=download.mimetype, as_attachment=True,
+                                   attachment_filename=download.file_name, conditional=True,
+                                   cache_timeout=results_api.DOWNLOAD_MAX_AGE)
+    elif download.is_not_modified(request.headers):
+        response = app.response_class("", status=304)
+    else:
+        response = app.response_class(await asyncio.to_thread(download.read), mimetype=download.mimetype,
+                                      headers=download.get_headers())
+        response.headers.set('Content-Disposition', 'attachment', filename=download.file_name)
+        await response.make_conditional(request, accept_ranges=True, complete_length=response.content_length)
+        return response
+    response.headers.update(download.get_headers())
+    return response
+
+
+@app.route('/download/<year>/<file_type>/<file_name>')
+async def download_file(year, file_type, file_name):
+    download = await asyncio.to_thread(results_api.get_download, match_index, archive_indexes,
+                                       results_api.get_contest_name(request.args, year), file_type, file_name,
+                                       'gzip' in request.accept_encodings)
+    if download is None:
+        abort(404)
+    return await send_download(download)
+
+
+@app.route('/tournament')
+async def tournament_page():
+    team_names = await asyncio.to_thread(results_api.get_all_team_names, match_index)
+    return await render_template('results_0_template.html', team_names=team_names)
+
+
+def send_query(contest, get_body):
+    """Same as in flask_app.py"""
+    result = results_api.answer_query(contest, request.args.items(multi=True), request.headers, get_body)
+    response = app.response_class("", status=304) if result.body is None else jsonify(result.body)
+    response.headers.update(result.headers)
+    return response
+
+
+@app.route('/get_matches')
+async def get_matches():
+    selected_year = request.args.get('year')
+    contest = await get_contest(selected_year)
+    return send_query(contest, lambda: results_api.get_matches(contest, selected_year, request.args))
+
+
+@app.route('/get_ranking')
+async def get_ranking():
+    contest = await get_contest(request.args.get('year'))
+    return send_query(contest, lambda: results_api.get_ranking(contest))
+
+
+@app.route('/get_teams')
+async def get_teams():
+    contest = await get_contest(request.args.get('year'))
+    return jsonify({'teams': list(contest.get_team_names())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Asynchronous results web server.')
+    parser.add_argument("--host", dest='host', type=str, default="127.0.0.1", help='address to listen on')
+    parser.add_argument("--port", dest='port', type=int, default=5000, help='port to listen on')
+    parser.add_argument("-w", "--workers", dest='workers', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run("results_server:app", host=args.host, port=args.port, workers=max(1, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Aggregated results of a contest, stored in www/contest_<name>/results.sqlite.
+
+The store indexes the score files (match_<id>.json) of the contest: each file is parsed once when it is first seen,
+so standings, game lists and team lookups cost O(new matches) instead of reloading every score file.
+
+The store also keeps the ratings of the teams (see ratings.py): the games of the new matches are rated as they are
+indexed, and the ratings are rebuilt by replaying all the games if a match that was already rated is removed or
+replaced. The ratings depend on the order of the games, so the order in which the matches were rated is logged and
+the games are always replayed in that order.
+"""
+import json
+import logging
+import os
+import pathlib
+import re
+import sqlite3
+import uuid
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Set, Tuple
+
+from ratings import Rating, RatingEngine
+
+SCORE_FILE_PATTERN = re.compile(r'match_([-+\dT:.]+)\.json')
+STORE_FILE_NAME = "results.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    match_id TEXT PRIMARY KEY,
+    max_steps INTEGER,
+    layouts TEXT
+);
+CREATE TABLE IF NOT EXISTS games (
+    match_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    team1 TEXT NOT NULL,
+    team2 TEXT NOT NULL,
+    game TEXT NOT NULL,
+    PRIMARY KEY (match_id, position)
+);
+CREATE INDEX IF NOT EXISTS games_team1 ON games (team1);
+CREATE INDEX IF NOT EXISTS games_team2 ON games (team2);
+CREATE TABLE IF NOT EXISTS teams_stats (
+    match_id TEXT NOT NULL,
+    team_name TEXT NOT NULL,
+    points_pct INTEGER, points INTEGER, wins INTEGER, draws INTEGER, losses INTEGER, errors INTEGER,
+    sum_score INTEGER,
+    PRIMARY KEY (match_id, team_name)
+);
+CREATE INDEX IF NOT EXISTS teams_stats_team ON teams_stats (team_name);
+CREATE TABLE IF NOT EXISTS store_info (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    match_id TEXT NOT NULL,
+    team_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ratings (
+    team_name TEXT PRIMARY KEY,
+    rating REAL NOT NULL,
+    deviation REAL NOT NULL,
+    games INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rating_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    match_id TEXT NOT NULL UNIQUE
+);
+"""
+
+_STATS_COLUMNS = "points_pct, points, wins, draws, losses, errors, sum_score"
+# Games are listed by match id, numerically when the ids are numbers, then by position in the match
+_GAMES_ORDER = "CAST(match_id AS INTEGER), match_id, position"
+
+
+def get_store_file(contest_dir: str) -> str:
+    return os.path.join(contest_dir, STORE_FILE_NAME)
+
+
+class ResultsStore:
+    """Index of the score files of a contest"""
+    contest_dir: str
+    scores_dir: str
+
+    def __init__(self, contest_dir: str, read_only: bool = False):
+        """
+        :param contest_dir: the www/contest_<name> directory, containing the scores directory
+        :param read_only: opens an existing store without writing it, e.g. in the web servers: only the contest
+            manager writes the store, so that concurrent writers on the shared file system never lock each other out
+        """
+        self.contest_dir = contest_dir
+        self.scores_dir = os.path.join(contest_dir, "scores")
+        if read_only:
+            store_uri = pathlib.Path(get_store_file(contest_dir)).absolute().as_uri()
+            self.connection = sqlite3.connect(f"{store_uri}?mode=ro", uri=True)
+            return
+        os.makedirs(contest_dir, exist_ok=True)
+        self.connection = sqlite3.connect(get_store_file(contest_dir))
+        with self.connection:
+            self.connection.executescript(_SCHEMA)
+            # Tells apart two stores of the same contest, e.g. if the file was deleted and rebuilt
+            self.connection.execute("INSERT OR IGNORE INTO store_info (key, value) VALUES ('id', ?)",
+                                    (uuid.uuid4().hex,))
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_match_ids(self) -> Set[str]:
+        return {match_id for (match_id,) in self.connection.execute("SELECT match_id FROM matches")}
+
+    def update(self) -> Tuple[List[str], List[str]]:
+        """
+        Indexes the score files that are not in the store yet and forgets the matches whose score file was deleted.
+
+        :return: the ids of the added and of the removed matches
+        """
+        score_files = {}
+        if os.path.isdir(self.scores_dir):
+            for score_filename in os.listdir(self.scores_dir):
+                match = SCORE_FILE_PATTERN.fullmatch(score_filename)
+                if match:
+                    score_files[match.group(1)] = score_filename
+        stored_ids = self.get_match_ids()
+        added = sorted(set(score_files) - stored_ids)
+        removed = sorted(stored_ids - set(score_files))
+        for match_id in removed:
+            self.remove_match(match_id)
+        for match_id in list(added):
+            try:
+                with open(os.path.join(self.scores_dir, score_files[match_id]), 'r') as f:
+                    match_data = json.load(f)
+            except ValueError:  # still being written by the game, it will be indexed by the next update
+                logging.warning(f"Score file {score_files[match_id]} cannot be parsed yet, skipped")
+                added.remove(match_id)
+                continue
+            self.add_match(match_id, match_data)
+        if added or removed:
+            logging.info(f"Results store {self.contest_dir}: {len(added)} matches added, {len(removed)} removed")
+        self.update_ratings()
+        return added, removed
+
+    def add_score_file(self, match_id: str) -> bool:
+        """Indexes the score file of a match that has just finished, returns False if there is no such file"""
+        score_file = os.path.join(self.scores_dir, f"match_{match_id}.json")
+        if not os.path.isfile(score_file):
+            return False
+        with open(score_file, 'r') as f:
+            self.add_match(match_id, json.load(f))
+        self.update_ratings()
+        return True
+
+    def add_match(self, match_id: str, match_data: dict) -> None:
+        """Adds (or replaces) the results of a match given the content of its score file"""
+        with self.connection:
+            self._delete_match(match_id)
+            self.connection.execute("INSERT INTO matches (match_id, max_steps, layouts) VALUES (?, ?, ?)",
+                                    (match_id, match_data.get('max_steps'), json.dumps(match_data.get('layouts', []))))
+            self.connection.executemany("INSERT INTO games (match_id, position, team1, team2, game) "
+                                        "VALUES (?, ?, ?, ?, ?)",
+                                        [(match_id, position, game[0], game[1], json.dumps(game))
+                                         for position, game in enumerate(match_data['games'])])
+            self.connection.executemany(f"INSERT INTO teams_stats (match_id, team_name, {_STATS_COLUMNS}) "
+                                        f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        [(match_id, team_name, *data)
+                                         for team_name, data in match_data['teams_stats'].items()])
+            self._log_change(match_id)
+
+    def remove_match(self, match_id: str) -> None:
+        with self.connection:
+            self._delete_match(match_id)
+
+    def _delete_match(self, match_id: str) -> None:
+        self._log_change(match_id)
+        for table in ("matches", "games", "teams_stats"):
+            self.connection.execute(f"DELETE FROM {table} WHERE match_id = ?", (match_id,))
+
+    def _log_change(self, match_id: str) -> None:
+        """Records that the results of the teams of a match changed"""
+        self.connection.execute("INSERT INTO changes (match_id, team_name) "
+                                "SELECT match_id, team_name FROM teams_stats WHERE match_id = ?", (match_id,))
+
+    def get_id(self) -> str:
+        return self.connection.execute("SELECT value FROM store_info WHERE key = 'id'").fetchone()[0]
+
+    def get_last_change(self) -> int:
+        """Sequence number of the last change, it grows every time a match is added or removed"""
+        return self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def get_changed_teams(self, since_change: int) -> Set[str]:
+        """Teams whose results changed after the given change sequence number"""
+        return {team_name for (team_name,) in
+                self.connection.execute("SELECT DISTINCT team_name FROM changes WHERE seq > ?", (since_change,))}
+
+    def update_ratings(self) -> None:
+        """
+        Rates the games of the matches added since the last update, in O(1) per game. If a rated match was removed
+        or replaced since then, the ratings are rebuilt: they depend on all the previous games and cannot be undone.
+        """
+        row = self.connection.execute("SELECT value FROM store_info WHERE key = 'ratings_change'").fetchone()
+        rated_change = int(row[0]) if row else 0
+        if rated_change == self.get_last_change():
+            return
+        changed_matches = "SELECT match_id FROM changes WHERE seq > ?"
+        if self.connection.execute(f"SELECT 1 FROM rating_log WHERE match_id IN ({changed_matches}) LIMIT 1",
+                                   (rated_change,)).fetchone():
+            # Forgetting the changed matches and replaying the others is a single transaction: the ratings never count
+            # a replaced match twice, even if the process is killed halfway
+            with self.connection:
+                # A replaced match is rated again after the others, as a new one
+                self.connection.execute(f"DELETE FROM rating_log WHERE match_id IN ({changed_matches})",
+                                        (rated_change,))
+                self._replay_ratings()
+            logging.info(f"Results store {self.contest_dir}: ratings rebuilt")
+            return
+        with self.connection:
+            self._rate_new_matches(RatingEngine(self.get_ratings()))
+
+    def rebuild_ratings(self) -> None:
+        """Recomputes the ratings from scratch, replaying all the games in the order their matches were rated"""
+        with self.connection:
+            self._replay_ratings()
+        logging.info(f"Results store {self.contest_dir}: ratings rebuilt")
+
+    def _replay_ratings(self) -> None:
+        """Body of rebuild_ratings, to be run in a transaction"""
+        self.connection.execute("DELETE FROM ratings")
+        self._rate_new_matches(RatingEngine(), since_seq=0)
+
+    def _rate_new_matches(self, engine: RatingEngine, since_seq: int = None) -> None:
+        """
+        Appends the matches that are not rated yet to the rating log, by match id, then rates the games of the
+        matches logged after since_seq (the matches just appended by default) and saves the new ratings of their teams
+        """
+        if since_seq is None:
+            since_seq = self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM rating_log").fetchone()[0]
+        self.connection.execute("INSERT INTO rating_log (match_id) SELECT match_id FROM matches "
+                                "WHERE match_id NOT IN (SELECT match_id FROM rating_log) "
+                                "ORDER BY CAST(match_id AS INTEGER), match_id")
+        rated_teams = set()
+        for (game,) in self.connection.execute("SELECT games.game FROM rating_log JOIN games USING (match_id) "
+                                               "WHERE rating_log.seq > ? ORDER BY rating_log.seq, games.position",
+                                               (since_seq,)):
+            game = json.loads(game)
+            engine.add_game(game)
+            rated_teams.update(game[:2])
+        self.connection.executemany("INSERT OR REPLACE INTO ratings (team_name, rating, deviation, games) "
+                                    "VALUES (?, ?, ?, ?)",
+                                    [(team_name, rating.rating, rating.deviation, rating.games)
+                                     for team_name, rating in engine.ratings.items() if team_name in rated_teams])
+        self.connection.execute("INSERT OR REPLACE INTO store_info (key, value) VALUES ('ratings_change', ?)",
+                                (str(self.get_last_change()),))
+
+    def get_ratings(self) -> Dict[str, Rating]:
+        """Current rating of every team that played, as of the last update"""
+        return {team_name: Rating(rating=rating, deviation=deviation, games=games)
+                for team_name, rating, deviation, games in
+                self.connection.execute("SELECT team_name, rating, deviation, games FROM ratings")}
+
+    def get_settings(self) -> Tuple[int, List[str]]:
+        """Returns the max steps and the layouts of the contest, taken from its first match"""
+        row = self.connection.execute("SELECT max_steps, layouts FROM matches ORDER BY rowid LIMIT 1").fetchone()
+        if row is None:
+            return None, []
+        return row[0], json.loads(row[1])
+
+    def iter_games(self) -> Iterator[list]:
+        """
+        All the games of the contest, read from the store one at a time:
+        (n1, n2, layout, score, winner, time_taken, match_id)
+        """
+        for (game,) in self.connection.execute(f"SELECT game FROM games ORDER BY {_GAMES_ORDER}"):
+            yield json.loads(game)
+
+    def get_match_games(self) -> List[Tuple[str, list]]:
+        """(match_id, game) of all the games of the contest"""
+        return [(match_id, json.loads(game)) for (match_id, game) in
+                self.connection.execute(f"SELECT match_id, game FROM games ORDER BY {_GAMES_ORDER}")]
+
+    def get_team_names(self) -> List[str]:
+        return [team_name for (team_name,) in
+                self.connection.execute("SELECT DISTINCT team_name FROM teams_stats ORDER BY team_name")]
+
+    def get_teams_stats(self) -> Dict[str, list]:
+        """
+        Stats of each team: points_pct (average over the matches the team played), and the sums of points, wins,
+        draws, losses, errors and sum_score
+        """
+        rows = self.connection.execute("SELECT team_name, CAST(AVG(points_pct) AS INTEGER), SUM(points), SUM(wins), "
+                                       "SUM(draws), SUM(losses), SUM(errors), SUM(sum_score) FROM teams_stats "
+                                       "GROUP BY team_name")
+        return {row[0]: list(row[1:]) for row in rows}
+
+    def get_team_durations(self) -> Dict[str, float]:
+        """Average duration in seconds of the matches played by each team (sum of the time_taken of their games)"""
+        rows = self.connection.execute("SELECT team_name, AVG(COALESCE(duration, 0)) FROM teams_stats "
+                                       "LEFT JOIN (SELECT match_id, SUM(json_extract(game, '$[5]')) AS duration "
+                                       "FROM games GROUP BY match_id) USING (match_id) GROUP BY team_name")
+        return dict(rows.fetchall())
+
+    def get_played_pairs(self) -> Set[FrozenSet[str]]:
+        """Pairs of teams that played each other at least once"""
+        return {frozenset(pair) for pair in self.connection.execute("SELECT DISTINCT team1, team2 FROM games")
+                if pair[0] != pair[1]}
+
+    def get_match_ids_of_teams(self, team_names: Iterable[str]) -> List[str]:
+        """Ids of the matches in which at least one of the given teams played"""
+        team_names = list(team_names)
+        if not team_names:
+            return []
+        placeholders = ", ".join("?" * len(team_names))
+        return [match_id for (match_id,) in
+                self.connection.execute(f"SELECT DISTINCT match_id FROM teams_stats "
+                                        f"WHERE team_name IN ({placeholders})", team_names)]
@@ -0,0 +1,206 @@
+"""
+Chooses the matches of a contest round: who plays whom, and with which colour.
+
+Formats:
+ - round-robin: every team plays every other team once (only the pairs with a new or updated team by default)
+ - swiss: teams are paired with teams of similar points that they have not played yet
+ - sampled: every team plays k opponents drawn at random
+ - adaptive: a budget of matches goes to the pairs of teams whose relative ranking is the most uncertain
+
+The pairings are deterministic for a given seed, and the blue/red colours are assigned so that every team plays
+about as many matches as blue as as red.
+"""
+import heapq
+import itertools
+import logging
+import math
+import random
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from ratings import RatingEngine, misranking_probability
+
+FORMAT_ROUND_ROBIN = "round-robin"
+FORMAT_SWISS = "swiss"
+FORMAT_SAMPLED = "sampled"
+FORMAT_ADAPTIVE = "adaptive"
+FORMATS = (FORMAT_ROUND_ROBIN, FORMAT_SWISS, FORMAT_SAMPLED, FORMAT_ADAPTIVE)
+# With the adaptive format, teams are only compared with the teams this close to them in the ranking
+ADAPTIVE_WINDOW = 16
+# and this fraction of the matches of every team is drawn at random, so that all the teams keep being compared
+# with the whole contest and not only with their neighbours in the (possibly wrong) current ranking
+ADAPTIVE_SAMPLED_FRACTION = 0.5
+
+Pairing = Tuple[str, str]
+
+
+def round_robin_pairs(team_names: List[str], new_team_names: Optional[Set[str]] = None) -> List[Pairing]:
+    """
+    All the pairs of teams, or only the pairs with at least one new team if new_team_names is given: the other
+    matches were already played. The latter costs O(new teams x teams) instead of O(teams^2).
+    """
+    if new_team_names is None:
+        return list(itertools.combinations(team_names, 2))
+    positions = {team_name: position for position, team_name in enumerate(team_names)}
+    pairs = set()
+    for new_team_name in new_team_names:
+        if new_team_name not in positions:
+            continue
+        for team_name in team_names:
+            if team_name != new_team_name:
+                pairs.add(tuple(sorted((new_team_name, team_name), key=positions.get)))
+    return sorted(pairs, key=lambda pair: (positions[pair[0]], positions[pair[1]]))
+
+
+def sampled_pairs(team_names: List[str], matches_per_team: int, rng: random.Random) -> List[Pairing]:
+    """
+    Every team plays matches_per_team opponents: the teams are put in a random circle and every team plays the
+    teams at distance 1 .. k/2 on both sides, plus the one across the circle if k is odd (with an odd number of
+    teams and an odd k, one team plays k - 1 matches).
+    """
+    num_teams = len(team_names)
+    if matches_per_team >= num_teams - 1:
+        return round_robin_pairs(team_names)
+    circle = list(team_names)
+    rng.shuffle(circle)
+    pairs = [(circle[i], circle[(i + distance) % num_teams])
+             for distance in range(1, matches_per_team // 2 + 1) for i in range(num_teams)]
+    if matches_per_team % 2 == 1:
+        if num_teams % 2 == 0:
+            pairs.extend((circle[i], circle[i + num_teams // 2]) for i in range(num_teams // 2))
+        else:
+            # Going round the circle by steps of (n - 1) / 2 visits every team, every other step is a match
+            step = (num_teams - 1) // 2
+            cycle = [circle[(i * step) % num_teams] for i in range(num_teams)]
+            pairs.extend((cycle[i], cycle[i + 1]) for i in range(0, num_teams - 1, 2))
+    return pairs
+
+
+def swiss_pairs(team_names: List[str], points: Dict[str, float], played_pairs: Set[FrozenSet[str]],
+                rounds: int, rng: random.Random) -> List[Pairing]:
+    """
+    Swiss-system rounds: the teams are ranked by points (ties broken at random) and every team is paired with the
+    next unpaired team of the ranking that it has not played yet, if any. With an odd number of teams, the last
+    unpaired team rests. Several rounds can be scheduled at once, but all of them are paired with the current points.
+    """
+    played_pairs = set(played_pairs)
+    tie_breaks = {team_name: rng.random() for team_name in team_names}
+    ranking = sorted(team_names, key=lambda team_name: (-points.get(team_name, 0), tie_breaks[team_name]))
+    pairs = []
+    for _ in range(rounds):
+        unpaired = list(ranking)
+        while len(unpaired) > 1:
+            team_name = unpaired.pop(0)
+            opponent = next((other for other in unpaired if frozenset((team_name, other)) not in played_pairs),
+                            unpaired[0])  # everybody was played already: rematch with the closest team
+            unpaired.remove(opponent)
+            played_pairs.add(frozenset((team_name, opponent)))
+            pairs.append((team_name, opponent))
+    return pairs
+
+
+def adaptive_pairs(team_names: List[str], engine: RatingEngine, budget: int, max_matches_per_team: int,
+                   rng: random.Random, window: int = ADAPTIVE_WINDOW,
+                   scheduled_pairs: Iterable[Pairing] = ()) -> List[Pairing]:
+    """
+    Spends a budget of matches on the pairs of teams whose order in the ranking is the most likely to be wrong.
+
+    Only teams at most window places apart in the ranking are paired: teams far apart are already well ordered,
+    and this keeps the candidates O(teams). Every match is given to the candidate pair with the highest probability of
+    being misranked, and the ratings of the pair are then assumed to become as certain as after a game, so the
+    following matches go to other pairs. No team plays more than max_matches_per_team matches, counting the
+    scheduled_pairs already chosen for the round (which are not returned nor chosen again).
+    """
+    ranking = list(team_names)
+    rng.shuffle(ranking)  # teams with the same rating, e.g. new teams, are paired at random
+    ranking.sort(key=lambda team_name: engine.get_rating(team_name).rating, reverse=True)
+    ratings = {team_name: engine.get_rating(team_name) for team_name in team_names}
+    num_matches = {team_name: 0 for team_name in team_names}
+
+    def add_pair(pair):
+        for team_name in pair:
+            num_matches[team_name] += 1
+        # The game will make both ratings more certain, as a game ending as expected would
+        ratings[pair[0]], ratings[pair[1]] = (RatingEngine.get_expected_rating(ratings[pair[0]], ratings[pair[1]]),
+                                              RatingEngine.get_expected_rating(ratings[pair[1]], ratings[pair[0]]))
+
+    scheduled = set()
+    for pair in scheduled_pairs:
+        add_pair(pair)
+        scheduled.add(frozenset(pair))
+
+    def get_priority(pair):
+        # Close ratings are not enough: the pair must also be uncertain, or its order is already settled
+        rating, other = ratings[pair[0]], ratings[pair[1]]
+        return -misranking_probability(rating, other) * math.hypot(rating.deviation, other.deviation)
+
+    candidates = [(get_priority(pair), pair) for i in range(len(ranking))
+                  for pair in ((ranking[i], other) for other in ranking[i + 1:i + 1 + window])
+                  if frozenset(pair) not in scheduled]
+    heapq.heapify(candidates)
+    pairs = []
+    while candidates and len(pairs) < budget:
+        priority, pair = heapq.heappop(candidates)
+        if any(num_matches[team_name] >= max_matches_per_team for team_name in pair):
+            continue
+        if priority != get_priority(pair):  # the ratings changed since the pair was pushed
+            heapq.heappush(candidates, (get_priority(pair), pair))
+            continue
+        pairs.append(pair)
+        add_pair(pair)
+        heapq.heappush(candidates, (get_priority(pair), pair))
+    return pairs
+
+
+def balance_colors(pairs: Iterable[Pairing], rng: random.Random) -> List[Pairing]:
+    """Orders every pair as (blue, red), giving blue to the team that played blue less often so far"""
+    balance = {}  # times blue - times red
+    matches = []
+    for team_name, opponent in pairs:
+        team_balance, opponent_balance = balance.get(team_name, 0), balance.get(opponent, 0)
+        if team_balance > opponent_balance or (team_balance == opponent_balance and rng.random() < 0.5):
+            team_name, opponent = opponent, team_name
+        balance[team_name] = balance.get(team_name, 0) + 1
+        balance[opponent] = balance.get(opponent, 0) - 1
+        matches.append((team_name, opponent))
+    return matches
+
+
+def schedule(contest_format: str, team_names: List[str], seed: str, new_team_names: Optional[Set[str]] = None,
+             matches_per_team: int = 4, rounds: int = 1, points: Dict[str, float] = None,
+             played_pairs: Set[FrozenSet[str]] = None, engine: RatingEngine = None,
+             budget: int = None) -> List[Pairing]:
+    """
+    Matches of a round of a contest, as (blue team, red team).
+
+    :param contest_format: one of FORMATS
+    :param team_names: teams that can play
+    :param seed: same seed and same teams give the same matches
+    :param new_team_names: for round-robin, play only the matches of these teams (all the matches if None)
+    :param matches_per_team: for sampled, number of opponents of every team
+    :param rounds: for swiss, number of rounds
+    :param points: for swiss, current points of every team
+    :param played_pairs: for swiss, pairs of teams that already played each other
+    :param engine: for adaptive, ratings of the teams
+    :param budget: for adaptive, number of matches (by default, matches_per_team matches per team)
+    """
+    rng = random.Random(seed)
+    team_names = sorted(team_names)
+    if contest_format == FORMAT_ROUND_ROBIN:
+        pairs = round_robin_pairs(team_names, new_team_names)
+    elif contest_format == FORMAT_SWISS:
+        pairs = swiss_pairs(team_names, points or {}, played_pairs or set(), rounds, rng)
+    elif contest_format == FORMAT_SAMPLED:
+        pairs = sampled_pairs(team_names, matches_per_team, rng)
+    elif contest_format == FORMAT_ADAPTIVE:
+        if budget is None:
+            budget = len(team_names) * matches_per_team // 2
+        # Every team plays at least its share of random matches, the rest of the budget goes to uncertain pairs
+        pairs = sampled_pairs(team_names, round(matches_per_team * ADAPTIVE_SAMPLED_FRACTION), rng)[:budget]
+        pairs += adaptive_pairs(team_names, engine or RatingEngine(), budget - len(pairs),
+                                max_matches_per_team=max(matches_per_team, 2 * budget // max(1, len(team_names))),
+                                rng=rng, scheduled_pairs=pairs)
+    else:
+        raise ValueError(f"Unknown contest format: {contest_format}")
+    matches = balance_colors(pairs, rng)
+    logging.info(f"Scheduled {len(matches)} {contest_format} matches for {len(team_names)} teams")
+    return matches
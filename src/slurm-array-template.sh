@@ -3,7 +3,8 @@
 #SBATCH -p medium
 #SBATCH -N 1
 #SBATCH -n 1
-#SBATCH --time=7:00
+#SBATCH -c $2
+#SBATCH --time=$3
 #SBATCH --array=1-$1:1                
 #SBATCH -o slurm-outputs/%N.%J.out # STDOUT
 #SBATCH -e slurm-outputs/%N.%j.err # STDERR
@@ -11,7 +12,7 @@
 #ml Python
 module --ignore-cache load "Python"
 source ../venv/bin/activate
-python contest_manager.py -s "run_matches" -t $SLURM_ARRAY_TASK_ID
+python contest_manager.py -s "run_matches" -t $SLURM_ARRAY_TASK_ID -j $SLURM_CPUS_PER_TASK
 
 deactivate
             
@@ -3,6 +3,7 @@
 #SBATCH -p medium
 #SBATCH -N 1
 #SBATCH -n 1
+#SBATCH -c 1
 #SBATCH --time=7:00
 #SBATCH --array=1-92:1                
 #SBATCH -o slurm-outputs/%N.%J.out # STDOUT
@@ -11,7 +12,7 @@
 #ml Python
 module --ignore-cache load "Python"
 source ../venv/bin/activate
-python contest_manager.py -s "run_matches" -t $SLURM_ARRAY_TASK_ID
+python contest_manager.py -s "run_matches" -t $SLURM_ARRAY_TASK_ID -j $SLURM_CPUS_PER_TASK
 
 deactivate
             
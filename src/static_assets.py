@@ -0,0 +1,141 @@
+"""
+Deploys the static assets of the results web site (fonts, style sheet and the static directory) into www.
+
+Every asset is hashed and only deployed if it changed since the last deployment, as recorded in
+www/static_assets.json. Files are replaced atomically, and directories are deployed into a new versioned directory
+www/.static_assets/<name>-<hash> that www/<name> is then (atomically) re-linked to, so a web server reading the
+assets never sees a half-written version.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import zipfile
+from typing import Dict, List, Tuple
+
+from json_files import dump_json
+
+ASSETS_MANIFEST_FILE_NAME = "static_assets.json"
+VERSIONS_DIR_NAME = ".static_assets"
+
+# (name of the asset in www, source relative to the sources directory)
+STATIC_ASSETS = [
+    ("fonts", "fonts.zip"),
+    ("style.css", "style.css"),
+    ("static", "static"),
+]
+
+
+def hash_path(path: str) -> str:
+    """Hash of the content of a file, or of the relative paths and contents of all the files of a directory"""
+    digest = hashlib.sha1()
+    if os.path.isfile(path):
+        file_paths = [(os.path.basename(path), path)]
+    else:
+        file_paths = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                file_paths.append((os.path.relpath(file_path, path), file_path))
+    for relative_path, file_path in file_paths:
+        digest.update(relative_path.encode())
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StaticAssetsDeployer:
+    """Idempotent deployment of the static assets of a sources directory into a www directory"""
+    source_dir: str
+    www_dir: str
+    assets: List[Tuple[str, str]]
+
+    def __init__(self, source_dir: str, www_dir: str, assets: List[Tuple[str, str]] = None):
+        """
+        :param source_dir: directory containing fonts.zip, style.css and the static directory
+        :param www_dir: the output path
+        :param assets: (name in www, source path) of every asset, STATIC_ASSETS by default
+        """
+        self.source_dir = source_dir
+        self.www_dir = www_dir
+        self.assets = STATIC_ASSETS if assets is None else assets
+        self.manifest_file = os.path.join(www_dir, ASSETS_MANIFEST_FILE_NAME)
+        self.versions_dir = os.path.join(www_dir, VERSIONS_DIR_NAME)
+
+    def _load_manifest(self) -> Dict[str, str]:
+        if not os.path.exists(self.manifest_file):
+            return {}
+        with open(self.manifest_file, "r") as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest: Dict[str, str]) -> None:
+        dump_json(manifest, self.manifest_file, sort_keys=True, indent=4)
+
+    def deploy(self) -> List[str]:
+        """
+        Deploys the assets that changed or are missing in www.
+
+        :return: the names of the deployed assets
+        """
+        os.makedirs(self.www_dir, exist_ok=True)
+        manifest = self._load_manifest()
+        deployed = []
+        for name, source in self.assets:
+            source_path = os.path.join(self.source_dir, source)
+            if not os.path.exists(source_path):
+                logging.warning(f"Static asset {source_path} not found, skipped")
+                continue
+            asset_hash = hash_path(source_path)
+            target = os.path.join(self.www_dir, name)
+            if manifest.get(name) == asset_hash and os.path.exists(target):
+                continue
+            if os.path.isfile(source_path) and not zipfile.is_zipfile(source_path):
+                self._deploy_file(source_path, target)
+            else:
+                self._deploy_dir(name, source_path, asset_hash, target)
+            manifest[name] = asset_hash
+            deployed.append(name)
+        if deployed:
+            self._save_manifest(manifest)
+            logging.info(f"Deployed static assets: {deployed}")
+        return deployed
+
+    @staticmethod
+    def _deploy_file(source_path: str, target: str) -> None:
+        shutil.copyfile(source_path, f"{target}.tmp")
+        os.replace(f"{target}.tmp", target)
+
+    def _deploy_dir(self, name: str, source_path: str, asset_hash: str, target: str) -> None:
+        """The directory is built aside, then www/<name> is switched to it and the previous versions are removed"""
+        version_name = f"{name}-{asset_hash}"
+        version_dir = os.path.join(self.versions_dir, version_name)
+        if not os.path.isdir(version_dir):
+            tmp_dir = f"{version_dir}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if os.path.isfile(source_path):  # zip file containing the <name> directory, e.g. fonts.zip
+                with zipfile.ZipFile(source_path) as zip_file:
+                    zip_file.extractall(tmp_dir)
+                extracted_dir = os.path.join(tmp_dir, name)
+                if os.path.isdir(extracted_dir):
+                    os.rename(extracted_dir, f"{tmp_dir}.content")
+                    shutil.rmtree(tmp_dir)
+                    os.rename(f"{tmp_dir}.content", tmp_dir)
+            else:
+                shutil.copytree(source_path, tmp_dir)
+            os.rename(tmp_dir, version_dir)
+
+        # Directories deployed before the assets were versioned cannot be replaced atomically by a link
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target)
+        tmp_link = f"{target}.tmp"
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.join(VERSIONS_DIR_NAME, version_name), tmp_link)
+        os.replace(tmp_link, target)
+
+        for old_version_name in os.listdir(self.versions_dir):
+            if old_version_name.startswith(f"{name}-") and old_version_name != version_name:
+                shutil.rmtree(os.path.join(self.versions_dir, old_version_name), ignore_errors=True)
@@ -1,31 +1,34 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass
+from json_files import get_field
 from member import Member
 from typing import List
 
 
 @dataclass
 class Team:
-    name: str = "default"
-    identifier: int = 0
-    repository: str = ""
-    last_commit: str = ""
-    updated: bool = False
-    syntax_error: bool = False
-    loading_error: bool = False
-    members: List[Member] = field(default_factory=list)
+    # Slotted: no per-instance __dict__, a contest can have hundreds of teams
+    __slots__ = ("name", "identifier", "repository", "last_commit", "updated", "syntax_error", "loading_error",
+                 "members")
+    name: str
+    identifier: int
+    repository: str
+    last_commit: str
+    updated: bool
+    syntax_error: bool
+    loading_error: bool
+    members: List[Member]
 
     def __init__(self, json_team: dict) -> None:
-        assert all(k in json_team for k in ("name", "id", "repository", "last_commit", "updated", "members"))
-        self.name = json_team["name"]
-        self.identifier = json_team["id"]
-        self.repository = json_team["repository"]
-        self.last_commit = json_team["last_commit"]
-        self.updated = json_team["updated"]
-        self.members = []
-        self.syntax_error = json_team["syntax_error"]
-        self.loading_error = json_team["loading_error"]
-        for json_member in json_team["members"]:
-            self.members.append(Member(json_member=json_member))
+        """Validates the fields of the team, raises ValueError if one is missing or has the wrong type"""
+        self.name = get_field(json_team, "name", str)
+        self.identifier = get_field(json_team, "id", int)
+        self.repository = get_field(json_team, "repository", str)
+        self.last_commit = get_field(json_team, "last_commit", str)
+        self.updated = get_field(json_team, "updated", bool)
+        # Not set in the teams files written before the agents were validated
+        self.syntax_error = get_field(json_team, "syntax_error", bool, default=False)
+        self.loading_error = get_field(json_team, "loading_error", bool, default=False)
+        self.members = [Member(json_member=json_member) for json_member in get_field(json_team, "members", list)]
 
     def get_name(self) -> str:
         return self.name
@@ -52,13 +55,14 @@ class Team:
         return self.members
 
     def to_json_obj(self):
+        # Keys in sorted order, as in the teams files: they are written as built, without sort_keys
         return {
-            "name": self.name,
             "id": self.identifier,
-            "repository": self.repository,
             "last_commit": self.last_commit,
-            "updated": self.updated,
-            "syntax_error": self.syntax_error,
             "loading_error": self.loading_error,
-            "members": [member.to_json_obj() for member in self.members]
+            "members": [member.to_json_obj() for member in self.members],
+            "name": self.name,
+            "repository": self.repository,
+            "syntax_error": self.syntax_error,
+            "updated": self.updated
         }
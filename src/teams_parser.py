@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 from team import Team
-from typing import List
+from typing import Dict, Iterable, List, Optional
 import json
 
 
@@ -8,26 +8,56 @@ import json
 class TeamsParser:
     """Parse all teams data from a JSON file"""
     teams: List[Team] = field(default_factory=list)
+    # Indexes of the teams by name and by id, kept consistent with self.teams by add_team and remove_team.
+    # Names are unique but ids are not always (e.g. placeholder teams), so the id index keeps all their teams
+    teams_by_name: Dict[str, Team] = field(default_factory=dict, repr=False, compare=False)
+    teams_by_id: Dict[int, List[Team]] = field(default_factory=dict, repr=False, compare=False)
 
     def __init__(self, json_file: str):
         assert len(json_file) > 5
         assert json_file[-5:] == ".json"
         self.teams = []
+        self.teams_by_name = {}
+        self.teams_by_id = {}
         with open(json_file, "r") as f:
             json_teams = json.load(f)
             assert "teams" in json_teams
             for json_team in json_teams["teams"]:
-                self.teams.append(Team(json_team=json_team))
+                self.add_team(Team(json_team=json_team))
 
     def get_teams(self) -> List[Team]:
         return self.teams
 
     def get_team(self, team_name) -> Team:
-        for team in self.teams:
-            if team.get_name() == team_name:
-                return team
-        return None
+        return self.teams_by_name.get(team_name)
+
+    def get_team_by_id(self, identifier) -> Team:
+        """First team with the given id"""
+        teams = self.teams_by_id.get(identifier)
+        return teams[0] if teams else None
+
+    def get_teams_by_name(self, team_names: Iterable[str]) -> List[Optional[Team]]:
+        """Bulk lookup: the team of each name, None for the unknown names"""
+        return [self.teams_by_name.get(team_name) for team_name in team_names]
+
+    def add_team(self, team: Team) -> None:
+        if team.get_name() in self.teams_by_name:
+            raise ValueError(f"Duplicated team name: {team.get_name()}")
+        self.teams.append(team)
+        self.teams_by_name[team.get_name()] = team
+        self.teams_by_id.setdefault(team.get_identifier(), []).append(team)
+
+    def remove_team(self, team_name: str) -> Team:
+        """Removes a team given its name and returns it, None if there is no such team"""
+        team = self.teams_by_name.pop(team_name, None)
+        if team is not None:
+            teams_with_id = self.teams_by_id[team.get_identifier()]
+            teams_with_id.remove(team)
+            if not teams_with_id:
+                del self.teams_by_id[team.get_identifier()]
+            self.teams.remove(team)
+        return team
 
     def to_json_obj(self):
         return {"teams": [team.to_json_obj() for team in self.teams]}
-        
+
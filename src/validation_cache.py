@@ -0,0 +1,96 @@
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Dict
+
+from agent_validator import ValidationResult
+from json_files import dump_json
+
+# Bump it whenever the validation performed by agent_validator changes, so that old outcomes are discarded
+VALIDATOR_VERSION = 1
+
+
+def hash_python_files(directory: str) -> str:
+    """Content hash of all the Python files below a directory"""
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file_name in sorted(files):
+            if not file_name.endswith(".py"):
+                continue
+            file_path = os.path.join(root, file_name)
+            digest.update(os.path.relpath(file_path, directory).encode())
+            with open(file_path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def hash_environment() -> str:
+    """Hash of the Python version and of the name and version of every installed distribution"""
+    digest = hashlib.sha1(sys.version.encode())
+    for name, version in sorted((str(dist.metadata["Name"]), str(dist.version))
+                                for dist in importlib.metadata.distributions()):
+        digest.update(f"\n{name}=={version}".encode())
+    return digest.hexdigest()
+
+
+def get_engine_version() -> str:
+    """
+    Version of what the agents are loaded against: the contest engine, derived from the sources of its package, and
+    the Python environment, as an agent that fails to import a module may load once the module is installed
+    """
+    spec = importlib.util.find_spec("contest")
+    if spec is None or not spec.submodule_search_locations:
+        return f"{VALIDATOR_VERSION}-unknown-{hash_environment()}"
+    return f"{VALIDATOR_VERSION}-{hash_python_files(list(spec.submodule_search_locations)[0])}-{hash_environment()}"
+
+
+@dataclass
+class ValidationCache:
+    """Persistent outcome of the agent validation of the teams of a contest, keyed by the team code version"""
+    json_file: str
+    engine_version: str
+    entries: Dict[str, dict] = field(default_factory=dict)
+
+    def __init__(self, json_file: str, engine_version: str):
+        self.json_file = json_file
+        self.engine_version = engine_version
+        self.entries = {}
+        if not os.path.exists(json_file):
+            return
+        with open(json_file, "r") as f:
+            json_cache = json.load(f)
+        if json_cache.get("engine_version") != engine_version:
+            logging.info(f"Validation cache {json_file} discarded, contest engine or Python environment changed")
+            return
+        self.entries = json_cache["teams"]
+
+    @staticmethod
+    def get_file_name(contest_name: str) -> str:
+        """The cache lives next to teams_<contest>.json"""
+        return f"validation_{contest_name}.json"
+
+    def get(self, team_name: str, code_version: str) -> ValidationResult:
+        """Returns the cached outcome for that version of the team code, None if it must be validated again"""
+        entry = self.entries.get(team_name)
+        if entry is None or not code_version or entry["code_version"] != code_version:
+            return None
+        return ValidationResult(**entry["result"])
+
+    def put(self, team_name: str, code_version: str, result: ValidationResult) -> None:
+        """Caches the outcome, unless it may be transient (timeout, crash): the team is then validated again"""
+        if not result.is_deterministic():
+            self.entries.pop(team_name, None)
+            return
+        self.entries[team_name] = {"code_version": code_version, "result": result.to_json_obj()}
+
+    def to_json_obj(self):
+        return {"engine_version": self.engine_version, "teams": self.entries}
+
+    def save(self) -> None:
+        dump_json(self.to_json_obj(), self.json_file, sort_keys=True, indent=4)
@@ -0,0 +1,78 @@
+"""
+Work queue of matches kept in a directory, shared by any number of worker processes on any machines that see the
+same file system.
+
+Every queued match is an empty file work_queue/pending/<position>_<match id>. A worker claims a match by renaming
+its file into work_queue/running/: the rename is atomic, so when several workers try to claim the same match only
+one of them succeeds and the others move on to the next one. The file is removed once the match is played; its
+outcome is recorded in the match ledger (see match_ledger.py). Workers pull a new match whenever they are free,
+so slow matches do not hold back the others as they do in a statically packed Slurm array.
+"""
+import logging
+import os
+import shutil
+import socket
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+QUEUE_DIR = "work_queue"
+PENDING_DIR_NAME = "pending"
+RUNNING_DIR_NAME = "running"
+
+
+class WorkQueue:
+    """Directory-based queue of match ids"""
+    queue_dir: str
+
+    def __init__(self, queue_dir: str = QUEUE_DIR):
+        self.queue_dir = queue_dir
+        self.pending_dir = os.path.join(queue_dir, PENDING_DIR_NAME)
+        self.running_dir = os.path.join(queue_dir, RUNNING_DIR_NAME)
+        self._listing = deque()
+        self._claimed: Dict[str, str] = {}  # file name of every match claimed by this process
+        self._lock = threading.Lock()
+
+    def reset(self, match_ids: List[str]) -> None:
+        """
+        Replaces the content of the queue by the given matches, claimed in this order. Matches still claimed by
+        workers are forgotten, so no worker should be running.
+        """
+        shutil.rmtree(self.queue_dir, ignore_errors=True)
+        os.makedirs(self.pending_dir)
+        os.makedirs(self.running_dir)
+        # The position keeps the order of the matches when the workers list the pending directory
+        width = len(str(len(match_ids)))
+        for position, match_id in enumerate(match_ids):
+            open(os.path.join(self.pending_dir, f"{position:0{width}d}_{match_id}"), "w").close()
+        logging.info(f"Queued {len(match_ids)} matches in {self.queue_dir}")
+
+    def claim(self) -> Optional[str]:
+        """Takes the next pending match of the queue, None if the queue is empty. Thread-safe."""
+        with self._lock:
+            for _ in range(2):
+                while self._listing:
+                    file_name = self._listing.popleft()
+                    try:
+                        os.rename(os.path.join(self.pending_dir, file_name),
+                                  os.path.join(self.running_dir, file_name))
+                    except FileNotFoundError:  # claimed by another worker
+                        continue
+                    # Tells who is playing the match, e.g. to find the matches of a worker that died
+                    with open(os.path.join(self.running_dir, file_name), "w") as f:
+                        f.write(f"{socket.gethostname()} {os.getpid()}\n")
+                    match_id = file_name.split("_", 1)[1]
+                    self._claimed[match_id] = file_name
+                    return match_id
+                # The directory is only listed again when all the matches of the previous listing were tried
+                self._listing = deque(sorted(os.listdir(self.pending_dir)) if os.path.isdir(self.pending_dir) else [])
+            return None
+
+    def release(self, match_id: str) -> None:
+        """Removes a match claimed by this process from the queue once it was played"""
+        with self._lock:
+            file_name = self._claimed.pop(match_id)
+        os.remove(os.path.join(self.running_dir, file_name))
+
+    def get_num_pending(self) -> int:
+        return len(os.listdir(self.pending_dir)) if os.path.isdir(self.pending_dir) else 0